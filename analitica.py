@@ -0,0 +1,294 @@
+import atexit
+import os
+import queue
+import sys
+import threading
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from georreferenciamento import RAIO_MEDIO_M, converter_para_hectares, parsear_pontos
+from travas import travar_arquivo
+
+# Registros estruturados das visitas em Parquet particionado por ano/mês (estilo Hive):
+#   dados/visitas/ano=2025/mes=5/part-<uuid>.parquet
+# Dados pessoais do proprietário (nome, CPF/CNPJ, telefone) não são gravados.
+# Cada gravação cria um arquivo pequeno; a partição é compactada automaticamente ao passar de
+# LIMITE_ARQUIVOS_POR_PARTICAO arquivos. A troca das partes pelo arquivo compactado e as leituras
+# ocorrem sob a trava .leitura.lock na raiz do conjunto, para que nenhuma leitura veja os dois.
+
+DIRETORIO_VISITAS_PADRAO = os.environ.get("VISITAS_PATH", os.path.join("dados", "visitas"))
+LIMITE_ARQUIVOS_POR_PARTICAO = 32
+INTERVALO_GRAVACAO_S = 5.0
+
+ESQUEMA_VISITA = pa.schema([
+    ("data_visita", pa.date32()),
+    ("gerado_em", pa.timestamp("s")),
+    ("municipio", pa.string()),
+    ("uf", pa.string()),
+    ("tipo_propriedade", pa.string()),
+    ("nome_propriedade", pa.string()),
+    ("numero_placa", pa.string()),
+    ("area_ha", pa.float64()),
+    ("area_georreferenciada_ha", pa.float64()),
+    ("lat_sede", pa.float64()),
+    ("lon_sede", pa.float64()),
+    ("possui_marca_gado", pa.bool_()),
+    ("possui_veiculos", pa.bool_()),
+    ("atividade_principal", pa.string()),
+])
+
+PARTICIONAMENTO = ds.partitioning(pa.schema([("ano", pa.int16()), ("mes", pa.int8())]), flavor="hive")
+
+
+def montar_registro(dados: dict) -> dict:
+    """Converte o dicionário `dados` de gerar_historico no registro estruturado da visita."""
+    try:
+        sede = parsear_pontos(dados['lat_long_sede'])
+    except ValueError:
+        sede = []
+    area_georreferenciada = dados.get('area_georreferenciada')
+    return {
+        "data_visita": datetime.strptime(dados['data'], "%d/%m/%Y").date(),
+        "gerado_em": datetime.now().replace(microsecond=0),
+        "municipio": dados['municipio'].strip(),
+        "uf": dados['uf'],
+        "tipo_propriedade": dados['tipo_propriedade'],
+        "nome_propriedade": dados['nome_propriedade'].strip(),
+        "numero_placa": dados['numero_placa'].strip().upper(),
+        "area_ha": converter_para_hectares(float(dados['area']), dados['unidade_area']),
+        "area_georreferenciada_ha": float(area_georreferenciada) if area_georreferenciada else None,
+        "lat_sede": float(sede[0][0]) if len(sede) else None,
+        "lon_sede": float(sede[0][1]) if len(sede) else None,
+        "possui_marca_gado": bool(dados['marca_gado']),
+        "possui_veiculos": bool(dados['veiculos']),
+        "atividade_principal": dados['atividade_principal'].strip(),
+    }
+
+
+def registrar_visitas(registros, diretorio=DIRETORIO_VISITAS_PADRAO):
+    """Acrescenta registros ao conjunto Parquet; cada chamada grava um arquivo novo por partição.
+
+    Partições que passarem de LIMITE_ARQUIVOS_POR_PARTICAO arquivos são compactadas em seguida.
+    """
+    tabela = pa.Table.from_pylist(list(registros), schema=ESQUEMA_VISITA)
+    if tabela.num_rows == 0:
+        return
+    datas = tabela.column("data_visita").to_pandas()
+    tabela = tabela.append_column("ano", pa.array(datas.map(lambda d: d.year), pa.int16()))
+    tabela = tabela.append_column("mes", pa.array(datas.map(lambda d: d.month), pa.int8()))
+    # Grava com prefixo "." (ignorado pelos leitores) e renomeia: uma leitura nunca pega um arquivo pela metade
+    temporarios = []
+    ds.write_dataset(
+        tabela, diretorio, format="parquet", partitioning=PARTICIONAMENTO,
+        basename_template=f".part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_visitor=lambda arquivo: temporarios.append(arquivo.path),
+    )
+    for temporario in temporarios:
+        pasta, nome = os.path.split(temporario)
+        os.replace(temporario, os.path.join(pasta, nome[1:]))
+    for ano, mes in set(zip(datas.map(lambda d: d.year), datas.map(lambda d: d.month))):
+        particao = os.path.join(diretorio, f"ano={ano}", f"mes={mes}")
+        if _contar_partes(particao) > LIMITE_ARQUIVOS_POR_PARTICAO:
+            _compactar_particao(particao, diretorio)
+
+
+def registrar_visita(dados: dict, diretorio=DIRETORIO_VISITAS_PADRAO):
+    """Acrescenta a visita de um histórico gerado ao conjunto Parquet."""
+    registrar_visitas([montar_registro(dados)], diretorio)
+
+
+class GravadorVisitas:
+    """Acumula visitas e as grava em lote por uma thread em segundo plano.
+
+    Usado pela API, onde um arquivo Parquet por requisição geraria milhares de arquivos pequenos;
+    registrar() apenas enfileira o registro.
+    """
+
+    def __init__(self, diretorio=DIRETORIO_VISITAS_PADRAO, intervalo=INTERVALO_GRAVACAO_S):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self._fila = queue.Queue()
+        self._encerrar = threading.Event()
+        self._thread = threading.Thread(target=self._gravar_continuamente, name="gravador-visitas", daemon=True)
+        self._thread.start()
+        atexit.register(self.fechar)
+
+    def registrar(self, dados: dict):
+        self._fila.put(montar_registro(dados))
+
+    def fechar(self, timeout=5.0):
+        if self._thread.is_alive():
+            self._encerrar.set()
+            self._thread.join(timeout)
+
+    def _gravar_continuamente(self):
+        while True:
+            encerrar = self._encerrar.wait(self.intervalo)
+            registros = []
+            while True:
+                try:
+                    registros.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            if registros:
+                try:
+                    registrar_visitas(registros, self.diretorio)
+                except Exception as e:
+                    print(f"Falha ao registrar {len(registros)} visita(s) para as análises: {e}", file=sys.stderr)
+            if encerrar:
+                return
+
+
+def _eh_parte(nome):
+    # Arquivos com "." na frente ainda estão sendo gravados
+    return nome.endswith(".parquet") and not nome.startswith(".")
+
+
+def _contar_partes(particao):
+    try:
+        return sum(1 for nome in os.listdir(particao) if _eh_parte(nome))
+    except FileNotFoundError:
+        return 0
+
+
+def _caminho_trava_leitura(diretorio):
+    return os.path.join(diretorio, ".leitura.lock")
+
+
+def _compactar_particao(particao, diretorio):
+    """Junta os arquivos de uma partição num só.
+
+    Uma trava no diretório da partição impede que dois processos compactem ao mesmo tempo (o que
+    duplicaria registros); se outro processo já estiver compactando, retorna sem fazer nada.
+    """
+    with travar_arquivo(os.path.join(particao, ".compactacao.lock"), bloquear=False) as obtida:
+        if not obtida:
+            return
+        partes = sorted(os.path.join(particao, a) for a in os.listdir(particao) if _eh_parte(a))
+        if len(partes) < 2:
+            return
+        tabela = pa.concat_tables(pq.read_table(p, schema=ESQUEMA_VISITA) for p in partes)
+        nome = f"part-{uuid.uuid4().hex}-0.parquet"
+        # Prefixo "." faz o pyarrow ignorar o arquivo temporário ao ler o conjunto
+        temporario = os.path.join(particao, f".{nome}.tmp")
+        pq.write_table(tabela, temporario)
+        # Publicar o compactado e remover as partes é uma única troca para os leitores
+        with travar_arquivo(_caminho_trava_leitura(diretorio)):
+            os.replace(temporario, os.path.join(particao, nome))
+            for parte in partes:
+                os.remove(parte)
+
+
+def compactar(diretorio=DIRETORIO_VISITAS_PADRAO):
+    """Junta os arquivos pequenos de cada partição num único arquivo."""
+    if not os.path.isdir(diretorio):
+        return
+    for raiz, _, arquivos in os.walk(diretorio):
+        if sum(1 for a in arquivos if _eh_parte(a)) >= 2:
+            _compactar_particao(raiz, diretorio)
+
+
+def _filtro_periodo(desde, ate):
+    # Ano e mês filtram as partições (diretórios fora do período nem são abertos); a data da visita
+    # filtra as linhas dentro dos meses das extremidades
+    filtro = None
+    if desde is not None:
+        filtro = (((ds.field("ano") > desde.year)
+                   | ((ds.field("ano") == desde.year) & (ds.field("mes") >= desde.month)))
+                  & (ds.field("data_visita") >= pa.scalar(desde, pa.date32())))
+    if ate is not None:
+        condicao = (((ds.field("ano") < ate.year)
+                     | ((ds.field("ano") == ate.year) & (ds.field("mes") <= ate.month)))
+                    & (ds.field("data_visita") <= pa.scalar(ate, pa.date32())))
+        filtro = condicao if filtro is None else filtro & condicao
+    return filtro
+
+
+def carregar_visitas(desde=None, ate=None, diretorio=DIRETORIO_VISITAS_PADRAO) -> pd.DataFrame:
+    """Lê as visitas do período informado (datas inclusivas) como DataFrame.
+
+    Os filtros de ano e mês são aplicados às partições, de modo que meses fora do período não são lidos.
+    """
+    if not os.path.isdir(diretorio):
+        return ESQUEMA_VISITA.empty_table().to_pandas()
+
+    filtro = _filtro_periodo(desde, ate)
+    # A trava compartilhada impede que uma compactação troque os arquivos entre a listagem e a leitura
+    with travar_arquivo(_caminho_trava_leitura(diretorio), exclusiva=False):
+        conjunto = ds.dataset(diretorio, format="parquet", partitioning=PARTICIONAMENTO)
+        tabela = conjunto.to_table(columns=ESQUEMA_VISITA.names, filter=filtro)
+    return tabela.to_pandas()
+
+
+def resumo_geral(visitas: pd.DataFrame) -> dict:
+    """Indicadores do período: visitas, propriedades cadastradas, área total e marcas de gado."""
+    # Uma propriedade é identificada pela placa; revisitas não somam área em dobro
+    propriedades = visitas.sort_values("gerado_em").drop_duplicates("numero_placa", keep="last")
+    return {
+        "visitas": int(len(visitas)),
+        "propriedades": int(len(propriedades)),
+        "municipios": int(propriedades["municipio"].nunique()),
+        "area_total_ha": float(propriedades["area_ha"].sum()),
+        "propriedades_com_marca_gado": int(propriedades["possui_marca_gado"].sum()),
+    }
+
+
+def visitas_por_semana(visitas: pd.DataFrame) -> pd.DataFrame:
+    """Quantidade de visitas por semana (início na segunda-feira) e município."""
+    if visitas.empty:
+        return pd.DataFrame(columns=["semana", "municipio", "visitas"])
+    semana = pd.to_datetime(visitas["data_visita"]).dt.to_period("W-SUN").dt.start_time
+    return (visitas.assign(semana=semana)
+            .groupby(["semana", "municipio"], observed=True).size()
+            .rename("visitas").reset_index()
+            .sort_values(["semana", "visitas"], ascending=[False, False]))
+
+
+def cobertura_por_municipio(visitas: pd.DataFrame) -> pd.DataFrame:
+    """Propriedades cadastradas, área e marcas de gado por município."""
+    if visitas.empty:
+        return pd.DataFrame(columns=["municipio", "uf", "propriedades", "area_ha", "com_marca_gado", "visitas"])
+    propriedades = visitas.sort_values("gerado_em").drop_duplicates("numero_placa", keep="last")
+    resumo = propriedades.groupby(["municipio", "uf"], observed=True).agg(
+        propriedades=("numero_placa", "size"),
+        area_ha=("area_ha", "sum"),
+        com_marca_gado=("possui_marca_gado", "sum"),
+    )
+    resumo["visitas"] = visitas.groupby(["municipio", "uf"], observed=True).size()
+    return resumo.reset_index().sort_values("propriedades", ascending=False)
+
+
+def propriedades_com_marca_gado(visitas: pd.DataFrame) -> pd.DataFrame:
+    """Lista das propriedades com marca/sinal/ferro de gado registrado."""
+    propriedades = visitas.sort_values("gerado_em").drop_duplicates("numero_placa", keep="last")
+    return (propriedades.loc[propriedades["possui_marca_gado"],
+                             ["numero_placa", "nome_propriedade", "municipio", "uf", "data_visita"]]
+            .sort_values(["municipio", "nome_propriedade"]))
+
+
+def visitas_proximas(visitas: pd.DataFrame, lat: float, lon: float, raio_km: float = 5.0,
+                     excluir_placa=None) -> pd.DataFrame:
+    """Última visita de cada propriedade cuja sede está a até raio_km do ponto informado.
+
+    excluir_placa deixa de fora a própria propriedade (ex.: a visita que acabou de ser registrada).
+    """
+    visitas = visitas.dropna(subset=["lat_sede", "lon_sede"])
+    if excluir_placa and excluir_placa.strip():
+        visitas = visitas[visitas["numero_placa"] != excluir_placa.strip().upper()]
+    if visitas.empty:
+        return visitas.assign(distancia_km=pd.Series(dtype="float64"))
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(visitas["lat_sede"].to_numpy()), np.radians(visitas["lon_sede"].to_numpy())
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distancia_km = 2 * RAIO_MEDIO_M * np.arcsin(np.sqrt(h)) / 1000
+    proximas = visitas.assign(distancia_km=distancia_km)
+    proximas = proximas[proximas["distancia_km"] <= raio_km]
+    return (proximas.sort_values("gerado_em").drop_duplicates("numero_placa", keep="last")
+            .sort_values("distancia_km"))
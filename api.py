@@ -0,0 +1,411 @@
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.httpserver
+import tornado.web
+
+from analitica import GravadorVisitas
+from auditoria import JornalAuditoria
+from estado import ERROS_BACKEND, URL_ESTADO_PADRAO, CacheRefinamento, EstadoMemoria, FilaTrabalhos, criar_backend
+from nucleo import validar_entrada, montar_dados, gerar_historico, refinar_texto, obter_chave_openai
+
+# API HTTP para integração com o sistema de despacho. Usa as mesmas funções do formulário
+# (nucleo.py). Rotas (JSON):
+#   GET  /saude          -> estado do serviço e ocupação da fila
+#   POST /v1/validar     -> {"erros": [...]}
+#   POST /v1/historico   -> {"historico": ..., "refinado": ..., "alertas": [...]}  (?refinar=0 pula a IA)
+#   POST /v1/refinar     -> {"refinado": ...}               corpo: {"texto": ...}
+#   POST /v1/lote        -> {"resultados": [...]}           corpo: {"entradas": [...], "refinar": true}
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_FILA_PADRAO = 64
+WORKERS_REFINAMENTO_PADRAO = 8
+TAMANHO_MAXIMO_LOTE = 100
+TAMANHO_MAXIMO_CORPO = 1024 * 1024
+TEMPO_OCIOSO_KEEP_ALIVE = 75
+# Tempo máximo de espera por um refinamento; trabalhos mais antigos são descartados pelos workers
+TEMPO_MAXIMO_REFINAMENTO_S = 60
+# Futures sem resposta são cancelados este tempo após o prazo, mesmo que ninguém os aguarde
+FOLGA_CANCELAMENTO_S = 5
+
+
+class FilaRefinamento:
+    """Fila limitada de refinamentos, compartilhada entre réplicas pelo backend de estado.
+
+    Os trabalhos vão para a FilaTrabalhos "refinamento" e são consumidos por um pool fixo de
+    workers de qualquer réplica; a resposta volta pela fila de respostas da réplica que
+    enfileirou. Quando a fila está cheia a requisição é recusada (HTTP 503) em vez de acumular
+    chamadas à OpenAI sem limite. Entre réplicas o limite é aproximado, pois a ocupação é
+    conferida antes de enfileirar. Com o backend indisponível, o refinamento é feito na própria
+    réplica, limitado ao mesmo tamanho.
+    """
+
+    def __init__(self, client, backend, tamanho=TAMANHO_FILA_PADRAO, workers=WORKERS_REFINAMENTO_PADRAO,
+                 cache=None, nome="refinamento"):
+        self.client = client
+        self.cache = cache
+        self.tamanho = tamanho
+        self.trabalhos = FilaTrabalhos(backend, nome=nome)
+        self.nome_respostas = f"{nome}:respostas:{uuid.uuid4().hex}"
+        self.respostas = FilaTrabalhos(backend, nome=self.nome_respostas, ttl=TEMPO_MAXIMO_REFINAMENTO_S)
+        self.backend = backend
+        self.loop = asyncio.get_event_loop()
+        self.pendentes = {}     # id do trabalho -> future aguardando a resposta
+        self.locais = 0         # refinamentos feitos na réplica com o backend indisponível
+        self._encerrar = threading.Event()
+        self.executor_local = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refinamento-local")
+        # Operações no backend saem do event loop (um Redis lento não trava as demais requisições)
+        self.executor_backend = ThreadPoolExecutor(max_workers=4, thread_name_prefix="fila-backend")
+        self.threads = [threading.Thread(target=self._worker, name=f"refinamento-{i}", daemon=True)
+                        for i in range(workers)]
+        self.threads.append(threading.Thread(target=self._receber_respostas, name="refinamento-respostas", daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    async def ocupacao(self):
+        """Trabalhos aguardando na fila compartilhada (None se o backend estiver indisponível)."""
+        try:
+            return await self.loop.run_in_executor(self.executor_backend, self.trabalhos.tamanho)
+        except ERROS_BACKEND:
+            return None
+
+    def _enfileirar_trabalhos(self, trabalhos):
+        if self.trabalhos.tamanho() + len(trabalhos) > self.tamanho:
+            raise asyncio.QueueFull
+        for trabalho in trabalhos:
+            self.trabalhos.enfileirar(trabalho)
+
+    async def enfileirar(self, textos):
+        """Enfileira os textos de uma vez e retorna os futures dos resultados.
+
+        Levanta asyncio.QueueFull se não couberem todos na fila.
+        """
+        prazo = time.time() + TEMPO_MAXIMO_REFINAMENTO_S
+        trabalhos = [{"id": uuid.uuid4().hex, "texto": texto, "responder_em": self.nome_respostas,
+                      "prazo": prazo} for texto in textos]
+        futuros = [self.loop.create_future() for _ in trabalhos]
+        # Registrados antes de enfileirar: a resposta pode chegar antes de run_in_executor retornar.
+        # Workers descartam trabalhos vencidos sem responder, então cada future sai de `pendentes`
+        # sozinho ao terminar, inclusive quando cancelado pelo timeout de quem aguarda
+        for trabalho, futuro in zip(trabalhos, futuros):
+            self.pendentes[trabalho["id"]] = futuro
+            cancelamento = self.loop.call_later(TEMPO_MAXIMO_REFINAMENTO_S + FOLGA_CANCELAMENTO_S, futuro.cancel)
+            futuro.add_done_callback(functools.partial(self._esquecer, trabalho["id"], cancelamento))
+        try:
+            await self.loop.run_in_executor(self.executor_backend, self._enfileirar_trabalhos, trabalhos)
+        except asyncio.QueueFull:
+            for futuro in futuros:
+                futuro.cancel()
+            raise
+        except ERROS_BACKEND as e:
+            logger.warning("Fila compartilhada indisponível, refinando nesta réplica: %s", e)
+            for futuro in futuros:
+                futuro.cancel()
+            return self._refinar_localmente(textos)
+        return futuros
+
+    def _esquecer(self, id_trabalho, cancelamento, _):
+        self.pendentes.pop(id_trabalho, None)
+        cancelamento.cancel()
+
+    def _refinar_localmente(self, textos):
+        if self.locais + len(textos) > self.tamanho:
+            raise asyncio.QueueFull
+        self.locais += len(textos)
+        futuros = []
+        for texto in textos:
+            futuro = asyncio.wrap_future(self.executor_local.submit(refinar_texto, self.client, texto, self.cache))
+            futuro.add_done_callback(self._liberar_local)
+            futuros.append(futuro)
+        return futuros
+
+    def _liberar_local(self, _):
+        self.locais -= 1
+
+    def _worker(self):
+        while not self._encerrar.is_set():
+            try:
+                trabalho = self.trabalhos.desenfileirar(timeout=1)
+            except ERROS_BACKEND:
+                self._encerrar.wait(1)
+                continue
+            # Quem enfileirou já desistiu de esperar: não gasta uma chamada à OpenAI
+            if trabalho is None or trabalho["prazo"] < time.time():
+                continue
+            try:
+                resposta = {"id": trabalho["id"], "refinado": refinar_texto(self.client, trabalho["texto"], self.cache)}
+            except Exception as e:
+                resposta = {"id": trabalho["id"], "erro": str(e)}
+            try:
+                FilaTrabalhos(self.backend, nome=trabalho["responder_em"], ttl=TEMPO_MAXIMO_REFINAMENTO_S).enfileirar(resposta)
+            except ERROS_BACKEND as e:
+                logger.warning("Resposta de refinamento perdida, backend indisponível: %s", e)
+
+    def _receber_respostas(self):
+        while not self._encerrar.is_set():
+            try:
+                resposta = self.respostas.desenfileirar(timeout=1)
+            except ERROS_BACKEND:
+                self._encerrar.wait(1)
+                continue
+            if resposta is not None:
+                self.loop.call_soon_threadsafe(self._resolver, resposta)
+
+    def _resolver(self, resposta):
+        futuro = self.pendentes.pop(resposta["id"], None)
+        if futuro is None or futuro.done():
+            return
+        if "erro" in resposta:
+            futuro.set_exception(RuntimeError(resposta["erro"]))
+        else:
+            futuro.set_result(resposta["refinado"])
+
+    def encerrar(self):
+        self._encerrar.set()
+        for thread in self.threads:
+            thread.join()
+        self.executor_local.shutdown(wait=False)
+        self.executor_backend.shutdown(wait=False)
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, fila, jornal, visitas):
+        self.fila = fila
+        self.jornal = jornal
+        self.visitas = visitas
+
+    def registrar_visita(self, dados):
+        """Registra a visita para as análises; uma falha aqui não afeta a resposta."""
+        if self.visitas is None:
+            return
+        try:
+            self.visitas.registrar(dados)
+        except Exception as e:
+            logger.warning("Visita não registrada para as análises: %s", e)
+
+    def auditar(self, entrada, historico, refinado, tempo_geracao_ms, tempo_refinamento_ms):
+        """Registra a geração no jornal de auditoria (o responsável vem do cabeçalho X-Responsavel)."""
+        if self.jornal is None:
+            return
+        self.jornal.registrar({
+            'origem': "api",
+            'responsavel': self.request.headers.get("X-Responsavel", ""),
+            'entrada': entrada,
+            'historico': historico,
+            'refinado': refinado,
+            'alterado_pela_ia': refinado is not None and refinado != historico,
+            'tempos_ms': {'geracao': round(tempo_geracao_ms, 3),
+                          'refinamento': round(tempo_refinamento_ms, 1) if tempo_refinamento_ms is not None else None},
+        })
+
+    def set_default_headers(self):
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+
+    def ler_json(self):
+        try:
+            corpo = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="JSON inválido")
+        if not isinstance(corpo, dict):
+            raise tornado.web.HTTPError(400, reason="O corpo deve ser um objeto JSON")
+        return corpo
+
+    def responder(self, dados, status=200):
+        self.set_status(status)
+        self.finish(json.dumps(dados, ensure_ascii=False))
+
+    def recusar_por_fila_cheia(self):
+        self.set_header("Retry-After", "5")
+        self.responder({"erro": "Fila de refinamento cheia, tente novamente."}, status=503)
+
+    def write_error(self, status_code, **kwargs):
+        self.finish(json.dumps({"erro": self._reason}, ensure_ascii=False))
+
+    async def aguardar_refinamento(self, futuro, texto):
+        """Aguarda um refinamento enfileirado; em falha da OpenAI devolve o texto original e o erro."""
+        try:
+            return await asyncio.wait_for(futuro, TEMPO_MAXIMO_REFINAMENTO_S), None
+        except asyncio.TimeoutError:
+            logger.warning("Refinamento sem resposta em %s s", TEMPO_MAXIMO_REFINAMENTO_S)
+            return texto, f"Refinamento sem resposta em {TEMPO_MAXIMO_REFINAMENTO_S} s"
+        except Exception as e:
+            logger.warning("Erro ao conectar com OpenAI: %s", e)
+            return texto, f"Erro ao conectar com OpenAI: {e}"
+
+    async def refinar(self, texto):
+        """Enfileira e aguarda um refinamento; levanta asyncio.QueueFull se a fila estiver cheia."""
+        futuro, = await self.fila.enfileirar([texto])
+        return await self.aguardar_refinamento(futuro, texto)
+
+
+class SaudeHandler(BaseHandler):
+    async def get(self):
+        ocupacao = await self.fila.ocupacao()
+        self.responder({
+            "status": "ok" if ocupacao is not None else "degradado",
+            "fila": ocupacao,
+            "vagas": self.fila.tamanho - ocupacao if ocupacao is not None else None,
+        })
+
+
+class ValidarHandler(BaseHandler):
+    def post(self):
+        self.responder({"erros": validar_entrada(self.ler_json())})
+
+
+class HistoricoHandler(BaseHandler):
+    async def post(self):
+        entrada = self.ler_json()
+        erros = validar_entrada(entrada)
+        if erros:
+            return self.responder({"erros": erros}, status=422)
+
+        inicio = time.perf_counter()
+        dados, alertas = montar_dados(entrada)
+        historico = gerar_historico(dados)
+        tempo_geracao_ms = (time.perf_counter() - inicio) * 1000
+        resposta = {"historico": historico, "refinado": None, "alertas": alertas}
+
+        tempo_refinamento_ms = None
+        if self.get_argument("refinar", "1") != "0":
+            inicio = time.perf_counter()
+            try:
+                resposta["refinado"], erro = await self.refinar(historico)
+            except asyncio.QueueFull:
+                return self.recusar_por_fila_cheia()
+            tempo_refinamento_ms = (time.perf_counter() - inicio) * 1000
+            if erro:
+                resposta["erro_refinamento"] = erro
+        self.auditar(entrada, historico, resposta["refinado"], tempo_geracao_ms, tempo_refinamento_ms)
+        self.registrar_visita(dados)
+        self.responder(resposta)
+
+
+class RefinarHandler(BaseHandler):
+    async def post(self):
+        texto = self.ler_json().get("texto")
+        if not isinstance(texto, str) or not texto.strip():
+            return self.responder({"erros": ["Informe o campo 'texto'."]}, status=422)
+        try:
+            refinado, erro = await self.refinar(texto)
+        except asyncio.QueueFull:
+            return self.recusar_por_fila_cheia()
+        resposta = {"refinado": refinado}
+        if erro:
+            resposta["erro_refinamento"] = erro
+        self.responder(resposta)
+
+
+class LoteHandler(BaseHandler):
+    async def post(self):
+        corpo = self.ler_json()
+        entradas = corpo.get("entradas")
+        if not isinstance(entradas, list) or not entradas:
+            return self.responder({"erros": ["Informe a lista 'entradas'."]}, status=422)
+        if len(entradas) > TAMANHO_MAXIMO_LOTE:
+            return self.responder({"erros": [f"Lote excede o máximo de {TAMANHO_MAXIMO_LOTE} entradas."]}, status=413)
+
+        resultados = []
+        tempos_geracao_ms = []
+        lista_dados = []
+        for entrada in entradas:
+            erros = validar_entrada(entrada) if isinstance(entrada, dict) else ["Entrada deve ser um objeto JSON."]
+            if erros:
+                resultados.append({"erros": erros})
+                continue
+            inicio = time.perf_counter()
+            dados, alertas = montar_dados(entrada)
+            lista_dados.append(dados)
+            resultados.append({"historico": gerar_historico(dados), "refinado": None, "alertas": alertas})
+            tempos_geracao_ms.append((time.perf_counter() - inicio) * 1000)
+        validos = [(e, r) for e, r in zip(entradas, resultados) if "historico" in r]
+
+        tempo_refinamento_ms = None
+        if corpo.get("refinar", True):
+            # Um lote maior que a fila nunca caberia nela: recusa definitiva, sem Retry-After
+            if len(validos) > self.fila.tamanho:
+                return self.responder({"erros": [
+                    f"Lote com refinamento excede a capacidade da fila ({self.fila.tamanho} entradas); "
+                    "divida o lote ou envie com \"refinar\": false."
+                ]}, status=413)
+            inicio = time.perf_counter()
+            # O lote só é aceito se couber inteiro na fila, para não ficar pela metade
+            try:
+                futuros = await self.fila.enfileirar([r["historico"] for _, r in validos])
+            except asyncio.QueueFull:
+                return self.recusar_por_fila_cheia()
+            refinados = await asyncio.gather(*(
+                self.aguardar_refinamento(futuro, r["historico"]) for futuro, (_, r) in zip(futuros, validos)
+            ))
+            tempo_refinamento_ms = (time.perf_counter() - inicio) * 1000
+            for (_, resultado), (refinado, erro) in zip(validos, refinados):
+                resultado["refinado"] = refinado
+                if erro:
+                    resultado["erro_refinamento"] = erro
+
+        # No lote, o tempo de refinamento registrado é o do lote inteiro
+        for (entrada, resultado), tempo_geracao_ms in zip(validos, tempos_geracao_ms):
+            self.auditar(entrada, resultado["historico"], resultado["refinado"], tempo_geracao_ms, tempo_refinamento_ms)
+        for dados in lista_dados:
+            self.registrar_visita(dados)
+        self.responder({"resultados": resultados})
+
+
+def criar_aplicacao(client, tamanho_fila=TAMANHO_FILA_PADRAO, workers=WORKERS_REFINAMENTO_PADRAO, cache=None,
+                    jornal=None, backend=None, visitas=None):
+    """Cria a aplicação Tornado. Deve ser chamada com o event loop já em execução.
+
+    `backend` (estado.BackendEstado) guarda a fila de refinamento; sem ele a fila fica na
+    memória do processo. `visitas` (analitica.GravadorVisitas) registra as visitas geradas.
+    """
+    backend = backend if backend is not None else EstadoMemoria()
+    fila = FilaRefinamento(client, backend, tamanho=tamanho_fila, workers=workers, cache=cache)
+    parametros = {"fila": fila, "jornal": jornal, "visitas": visitas}
+    return tornado.web.Application([
+        (r"/saude", SaudeHandler, parametros),
+        (r"/v1/validar", ValidarHandler, parametros),
+        (r"/v1/historico", HistoricoHandler, parametros),
+        (r"/v1/refinar", RefinarHandler, parametros),
+        (r"/v1/lote", LoteHandler, parametros),
+    ])
+
+
+async def executar(porta, tamanho_fila, workers, url_estado):
+    from openai import OpenAI
+
+    backend = criar_backend(url_estado)
+    aplicacao = criar_aplicacao(OpenAI(api_key=obter_chave_openai()), tamanho_fila, workers, CacheRefinamento(backend),
+                                JornalAuditoria(), backend, GravadorVisitas())
+    # HTTP/1.1 com keep-alive; conexões ociosas são encerradas após TEMPO_OCIOSO_KEEP_ALIVE segundos
+    servidor = tornado.httpserver.HTTPServer(
+        aplicacao,
+        max_body_size=TAMANHO_MAXIMO_CORPO,
+        idle_connection_timeout=TEMPO_OCIOSO_KEEP_ALIVE,
+    )
+    servidor.listen(porta)
+    logger.info("API ouvindo na porta %s", porta)
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP do Gerador de Histórico Policial")
+    parser.add_argument("--porta", type=int, default=8502)
+    parser.add_argument("--tamanho-fila", type=int, default=TAMANHO_FILA_PADRAO)
+    parser.add_argument("--workers", type=int, default=WORKERS_REFINAMENTO_PADRAO)
+    parser.add_argument("--estado", default=URL_ESTADO_PADRAO, help="memoria:// ou redis://host:porta/db")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(executar(args.porta, args.tamanho_fila, args.workers, args.estado))
+
+
+if __name__ == "__main__":
+    main()
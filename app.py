@@ -1,52 +1,90 @@
 import streamlit as st
 from openai import OpenAI
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import streamlit.components.v1 as components
 import re
+import time
+import uuid
+from georreferenciamento import (
+    parsear_pontos,
+    calcular_area_perimetro,
+    converter_para_hectares,
+    verificar_discrepancia_area,
+)
+from geocodificacao import IndiceMunicipios, CAMINHO_MALHA_PADRAO, conferir_municipio
+from estado import URL_ESTADO_PADRAO, CacheRefinamento, Rascunhos, criar_backend
+from analitica import (
+    registrar_visita,
+    carregar_visitas,
+    resumo_geral,
+    visitas_por_semana,
+    cobertura_por_municipio,
+    propriedades_com_marca_gado,
+    visitas_proximas,
+)
+from mapa import CacheTiles, montar_mosaico, criar_mapa
+from auditoria import JornalAuditoria
+from nucleo import validar_campos, adicionar_perimetro, gerar_historico, refinar_texto
 
 # Configurar cliente OpenAI usando secrets do Streamlit
 client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
 
-def validar_formato_hora_strptime(hora_str: str) -> bool:
-    """Valida se a string da hora está no formato HH:MM e se os valores são válidos."""
-    if not isinstance(hora_str, str):
-        return False
-    
-    # Remove espaços em branco
-    hora_str = hora_str.strip()
-    
-    # Verifica se está vazio
-    if not hora_str:
-        return False
-    
-    # Verifica formato básico com regex
-    if not re.match(r'^\d{1,2}:\d{2}$', hora_str):
-        return False
-    
+@st.cache_resource
+def obter_estado_compartilhado():
+    """Backend de estado compartilhado entre réplicas (ESTADO_URL nos secrets ou no ambiente)."""
+    backend = criar_backend(st.secrets.get("ESTADO_URL", URL_ESTADO_PADRAO))
+    return CacheRefinamento(backend), Rascunhos(backend)
+
+# Campos do formulário guardados no rascunho: chave do widget -> chave em `dados`.
+# Nome, CPF/CNPJ e telefone do proprietário ficam de fora (estado.CAMPOS_FORA_DO_RASCUNHO).
+WIDGETS_RASCUNHO = {
+    "comp_hora_inicio": 'hora_inicio',
+    "comp_hora_fim": 'hora_fim',
+    "tipo_prop_sel": 'tipo_propriedade',
+    "nome_prop_text": 'nome_propriedade',
+    "endereco_text_area": 'endereco',
+    "municipio_text": 'municipio',
+    "uf_sel": 'uf',
+    "lat_long_porteira_input": 'lat_long_porteira',
+    "lat_long_sede_input": 'lat_long_sede',
+    "pontos_perimetro_text_area": 'pontos_perimetro',
+    "area_num_input": 'area',
+    "unidade_area_sel": 'unidade_area',
+    "atividade_text": 'atividade_principal',
+    "veiculos_text_area": 'veiculos',
+    "marca_gado_text": 'marca_gado',
+    "numero_placa_text": 'numero_placa',
+}
+
+def restaurar_rascunho(rascunhos, id_rascunho):
+    """Preenche o formulário com o rascunho salvo, uma vez por sessão (ex.: ao cair em outra réplica)."""
+    if st.session_state.get("rascunho_restaurado"):
+        return
+    st.session_state["rascunho_restaurado"] = True
+    rascunho = rascunhos.carregar(id_rascunho)
+    if not rascunho:
+        return
+    for chave_widget, chave in WIDGETS_RASCUNHO.items():
+        if rascunho.get(chave) is not None:
+            st.session_state[chave_widget] = rascunho[chave]
+    if rascunho.get('data_visita'):
+        st.session_state["data_visita_input"] = date.fromisoformat(rascunho['data_visita'])
+    st.info(f"📝 Rascunho de {rascunho['salvo_em']} recuperado. Nome, CPF/CNPJ e telefone do proprietário não são guardados no rascunho; preencha-os novamente.")
+
+def salvar_rascunho(rascunhos, id_rascunho, data_visita):
+    """Guarda os campos do formulário (exceto os dados pessoais do proprietário) no rascunho."""
+    rascunho = {chave: st.session_state.get(chave_widget) for chave_widget, chave in WIDGETS_RASCUNHO.items()}
+    rascunho['data_visita'] = data_visita.isoformat() if data_visita else None
+    rascunho['salvo_em'] = datetime.now().strftime("%d/%m/%Y %H:%M")
+    rascunhos.salvar(id_rascunho, rascunho)
+
+@st.cache_resource
+def carregar_indice_municipios():
+    """Carrega a malha municipal do IBGE uma única vez; retorna None se o arquivo não existir."""
     try:
-        # Tenta fazer o parse
-        # strptime("%H:%M") espera horas como "00"-"23" e minutos "00"-"59".
-        # Se a regex permitir "H:MM", strptime falhará para horas de um dígito sem zero à esquerda.
-        # No entanto, o placeholder e a ajuda sugerem "HH:MM", então o comportamento atual está ok.
-        time_obj = datetime.strptime(hora_str, "%H:%M")
-        
-        # Validação adicional dos valores (pode ser redundante se strptime for bem-sucedido, mas não prejudica)
-        parts = hora_str.split(':')
-        if len(parts) != 2: # Já coberto pelo regex e strptime, mas para segurança.
-            return False
-            
-        hour = int(parts[0])
-        minute = int(parts[1])
-        
-        # Verifica se hora e minuto estão em ranges válidos
-        if hour < 0 or hour > 23:
-            return False
-        if minute < 0 or minute > 59:
-            return False
-            
-        return True
-    except (ValueError, IndexError):
-        return False
+        return IndiceMunicipios.carregar(CAMINHO_MALHA_PADRAO)
+    except FileNotFoundError:
+        return None
 
 def time_input_native(label: str, key: str) -> str:
     """Input de hora usando apenas Streamlit nativo"""
@@ -119,6 +157,72 @@ def obter_localizacao():
         <div id="status" style="margin-top: 15px; font-weight: bold; font-size: 14px;"></div>
         <div id="coordinates" style="margin-top: 15px; display: none;"></div>
         
+        <h4 style="margin-top: 20px; color: #0066cc;">📐 Perímetro da Propriedade</h4>
+        <div style="margin-bottom: 15px; display: flex; flex-wrap: wrap; gap: 10px; justify-content: center;">
+            <button onclick="startBoundary()" style="
+                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
+                color: white; 
+                border: none; 
+                padding: 12px 20px; 
+                border-radius: 8px; 
+                cursor: pointer;
+                font-size: 14px;
+                flex: 1 1 auto;
+                min-width: 140px;
+                text-align: center;
+            ">
+                ▶️ Iniciar Percurso
+            </button>
+            
+            <button onclick="markBoundaryPoint()" style="
+                background: linear-gradient(135deg, #4CAF50 0%, #45a049 100%); 
+                color: white; 
+                border: none; 
+                padding: 12px 20px; 
+                border-radius: 8px; 
+                cursor: pointer;
+                font-size: 14px;
+                flex: 1 1 auto;
+                min-width: 140px;
+                text-align: center;
+            ">
+                ➕ Marcar Ponto
+            </button>
+            
+            <button onclick="finishBoundary()" style="
+                background: linear-gradient(135deg, #ff9800 0%, #f57c00 100%); 
+                color: white; 
+                border: none; 
+                padding: 12px 20px; 
+                border-radius: 8px; 
+                cursor: pointer;
+                font-size: 14px;
+                flex: 1 1 auto;
+                min-width: 140px;
+                text-align: center;
+            ">
+                ⏹️ Finalizar
+            </button>
+            
+            <button onclick="clearBoundary()" style="
+                background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%); 
+                color: white; 
+                border: none; 
+                padding: 12px 20px; 
+                border-radius: 8px; 
+                cursor: pointer;
+                font-size: 14px;
+                flex: 1 1 auto;
+                min-width: 100px;
+                text-align: center;
+            ">
+                🗑️ Limpar
+            </button>
+        </div>
+        
+        <div id="boundaryStatus" style="margin-top: 10px; font-weight: bold; font-size: 14px;"></div>
+        <div id="boundaryPoints" style="margin-top: 10px; display: none;"></div>
+        
     </div>
 
     <script>
@@ -472,6 +576,153 @@ def obter_localizacao():
         }
     }
     
+    // Modo perímetro: registra uma sequência de fixações ao longo da cerca
+    let boundaryPoints = [];
+    let boundaryWatchId = null;
+    let lastBoundaryFix = null;
+    const boundaryMaxAccuracy = 20;  // metros; fixações piores são descartadas
+    const boundaryMinSpacing = 5;    // metros entre pontos registrados automaticamente
+    
+    function distanceMeters(lat1, lng1, lat2, lng2) {
+        const toRad = Math.PI / 180;
+        const dLat = (lat2 - lat1) * toRad;
+        const dLng = (lng2 - lng1) * toRad;
+        const h = Math.sin(dLat / 2) ** 2 + Math.cos(lat1 * toRad) * Math.cos(lat2 * toRad) * Math.sin(dLng / 2) ** 2;
+        return 2 * 6371008.8 * Math.asin(Math.sqrt(h));
+    }
+    
+    function addBoundaryPoint(lat, lng) {
+        boundaryPoints.push(`${lat.toFixed(8)}, ${lng.toFixed(8)}`);
+        sessionStorage.setItem('gps_boundary', boundaryPoints.join("\n"));
+    }
+    
+    function startBoundary() {
+        const status = document.getElementById("boundaryStatus");
+        
+        if (!navigator.geolocation) {
+            status.innerHTML = "❌ Geolocalização não é suportada por este navegador.";
+            status.style.color = "#dc3545";
+            return;
+        }
+        if (boundaryWatchId) return;
+        
+        status.innerHTML = "🚶 Percorra a cerca. Pontos são registrados automaticamente a cada " + boundaryMinSpacing + " m.";
+        status.style.color = "#007bff";
+        
+        boundaryWatchId = navigator.geolocation.watchPosition(
+            function(position) {
+                const lat = position.coords.latitude;
+                const lng = position.coords.longitude;
+                const accuracy = position.coords.accuracy;
+                lastBoundaryFix = { lat: lat, lng: lng, accuracy: accuracy };
+                
+                if (accuracy > boundaryMaxAccuracy) {
+                    status.innerHTML = `⚠️ Precisão insuficiente (±${Math.round(accuracy)}m). Aguardando sinal melhor...`;
+                    status.style.color = "#ff9800";
+                    return;
+                }
+                
+                const last = boundaryPoints.length ? boundaryPoints[boundaryPoints.length - 1].split(", ").map(Number) : null;
+                if (!last || distanceMeters(last[0], last[1], lat, lng) >= boundaryMinSpacing) {
+                    addBoundaryPoint(lat, lng);
+                }
+                status.innerHTML = `🚶 ${boundaryPoints.length} pontos registrados (±${Math.round(accuracy)}m)`;
+                status.style.color = "#28a745";
+            },
+            function(error) {
+                status.innerHTML = "❌ Erro ao registrar percurso: " + error.message;
+                status.style.color = "#dc3545";
+            },
+            {
+                enableHighAccuracy: true,
+                timeout: 30000,
+                maximumAge: 0
+            }
+        );
+    }
+    
+    function markBoundaryPoint() {
+        const status = document.getElementById("boundaryStatus");
+        const fix = lastBoundaryFix || (currentCoords ? { lat: Number(currentCoords.lat), lng: Number(currentCoords.lng), accuracy: currentCoords.accuracy } : null);
+        
+        if (!fix) {
+            status.innerHTML = "📐 Nenhuma fixação disponível. Inicie o percurso ou obtenha a localização primeiro.";
+            status.style.color = "#ff9800";
+            return;
+        }
+        addBoundaryPoint(fix.lat, fix.lng);
+        status.innerHTML = `➕ Ponto ${boundaryPoints.length} marcado (±${Math.round(fix.accuracy)}m)`;
+        status.style.color = "#28a745";
+    }
+    
+    function finishBoundary() {
+        const status = document.getElementById("boundaryStatus");
+        const pointsDiv = document.getElementById("boundaryPoints");
+        
+        if (boundaryWatchId) {
+            navigator.geolocation.clearWatch(boundaryWatchId);
+            boundaryWatchId = null;
+        }
+        
+        if (boundaryPoints.length < 3) {
+            status.innerHTML = `⚠️ São necessários ao menos 3 pontos (registrados: ${boundaryPoints.length}).`;
+            status.style.color = "#ff9800";
+            return;
+        }
+        
+        status.innerHTML = `✅ Perímetro com ${boundaryPoints.length} pontos. Copie e cole no campo "Pontos do perímetro".`;
+        status.style.color = "#28a745";
+        
+        pointsDiv.innerHTML = `
+            <textarea id="boundaryText" readonly style="width: 100%; height: 90px; font-family: 'Courier New', monospace; font-size: 12px;">${boundaryPoints.join("\n")}</textarea>
+            <button onclick="copyBoundary()" style="
+                background: linear-gradient(135deg, #28a745 0%, #20c997 100%);
+                color: white;
+                border: none;
+                padding: 10px 16px;
+                border-radius: 8px;
+                cursor: pointer;
+                font-size: 14px;
+                font-weight: bold;
+                width: 100%;
+                margin-top: 8px;
+            ">
+                📋 Copiar Pontos do Perímetro
+            </button>
+        `;
+        pointsDiv.style.display = "block";
+    }
+    
+    function copyBoundary() {
+        const textArea = document.getElementById("boundaryText");
+        const textToCopy = boundaryPoints.join("\n");
+        
+        if (navigator.clipboard && navigator.clipboard.writeText) {
+            navigator.clipboard.writeText(textToCopy).catch(function() {
+                textArea.select();
+                document.execCommand('copy');
+            });
+        } else {
+            textArea.select();
+            document.execCommand('copy');
+        }
+    }
+    
+    function clearBoundary() {
+        if (boundaryWatchId) {
+            navigator.geolocation.clearWatch(boundaryWatchId);
+            boundaryWatchId = null;
+        }
+        boundaryPoints = [];
+        lastBoundaryFix = null;
+        sessionStorage.removeItem('gps_boundary');
+        
+        const status = document.getElementById("boundaryStatus");
+        const pointsDiv = document.getElementById("boundaryPoints");
+        if (status) status.innerHTML = "🗑️ Perímetro limpo.";
+        if (pointsDiv) pointsDiv.style.display = "none";
+    }
+    
     function clearLocation() {
         if (watchId) {
             navigator.geolocation.clearWatch(watchId);
@@ -500,7 +751,7 @@ def obter_localizacao():
     </script>
     """
     
-    components.html(html_code, height=450) 
+    components.html(html_code, height=750) 
 
 def criar_botao_copiar(texto):
     texto_escapado = texto.replace('`', '\\`').replace('"', '\\"').replace("'", "\\'")
@@ -604,35 +855,104 @@ def criar_botao_copiar(texto):
 
 def refinar_texto_com_openai(texto):
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini", # ou outro modelo que preferir
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Você é um assistente especializado em correção gramatical, coesão e coerência de textos oficiais da Polícia Militar. Corrija apenas erros gramaticais, melhore a coesão e coerência do texto, mantendo o formato original e o tom formal. Não altere informações factuais ou dados específicos."
-                },
-                {
-                    "role": "user",
-                    "content": f"Por favor, corrija este relatório policial mantendo todas as informações originais, apenas melhorando a gramática, coesão e coerência:\n\n{texto}"
-                }
-            ],
-            max_tokens=2000, # Ajuste conforme necessário
-            temperature=0.3
-        )
-        return response.choices[0].message.content
+        cache_refinamento, _ = obter_estado_compartilhado()
+        return refinar_texto(client, texto, cache=cache_refinamento)
     except Exception as e:
         st.error(f"Erro ao conectar com OpenAI: {str(e)}")
         return texto # Retorna o texto original em caso de erro
 
-def gerar_historico(dados):
-    # Template permanece o mesmo
-    template = f"""Em atendimento à Ordem de Serviço, vinculada ao Programa de Segurança Rural no Vale do Jamari, foi realizada uma visita técnica em {dados['data']}, com início às {dados['hora_inicio']} e término às {dados['hora_fim']}. A diligência ocorreu na propriedade rural denominada {dados['tipo_propriedade']} "{dados['nome_propriedade']}", situada em {dados['endereco']}, na Zona Rural do município de {dados['municipio']}/{dados['uf']}. Procedeu-se ao levantamento das coordenadas geográficas, sendo a porteira de acesso principal localizada em {dados['lat_long_porteira']}, e a sede/residência principal em {dados['lat_long_sede']}. A área total da propriedade compreende {dados['area']} {dados['unidade_area']}. O proprietário, Sr. "{dados['nome_proprietario']}", inscrito no CPF/CNPJ sob o nº "{dados['cpf_cnpj']}", com contato telefônico principal "{dados['telefone']}", esteve presente durante a visita. A principal atividade econômica desenvolvida no local é "{dados['atividade_principal']}"."""
-    if dados['veiculos']:
-        template += f" Foram identificados os seguintes veículos automotores na propriedade: {dados['veiculos']}."
-    if dados['marca_gado']:
-        template += f" O rebanho possui marca/sinal/ferro registrado como \"{dados['marca_gado']}\"."
-    template += f""" A visita teve como objetivo central o cadastro e georreferenciamento da propriedade no sistema do Programa de Segurança Rural, o que foi efetivado. Consequentemente, foi afixada a placa de identificação do programa, de nº "{dados['numero_placa']}", entregue via mídia digital. Adicionalmente, foram repassadas ao proprietário orientações concernentes ao programa mencionado, a fim de sanar as dúvidas existentes. A presente visita cumpriu os objetivos estabelecidos pela referida Ordem de Serviço, sendo as informações coletadas e registradas com base nas declarações do proprietário e na verificação in loco."""
-    return template
+@st.cache_resource
+def obter_jornal_auditoria():
+    """Jornal de auditoria único por processo (a gravação ocorre em segundo plano)."""
+    return JornalAuditoria()
+
+@st.cache_resource
+def obter_cache_tiles():
+    """Cache de tiles em disco, compartilhado pelas sessões do processo."""
+    return CacheTiles()
+
+def coordenada_ou_none(texto):
+    try:
+        pontos = parsear_pontos(texto)
+    except ValueError:
+        return None
+    return (float(pontos[0, 0]), float(pontos[0, 1])) if len(pontos) else None
+
+def exibir_mapa(lat_long_porteira, lat_long_sede, pontos_perimetro, numero_placa="", permitir_rede=True):
+    """Pré-visualização do mapa com porteira, sede, perímetro e visitas anteriores próximas (offline).
+
+    Visitas da própria placa não aparecem como "Visita anterior". Com permitir_rede=False usa só os
+    tiles já em cache (mapa exibido após gerar o histórico).
+    """
+    st.header("🗺️ Mapa da Propriedade")
+    pontos = []
+    for tipo, texto in (("Porteira", lat_long_porteira), ("Sede", lat_long_sede)):
+        coordenada = coordenada_ou_none(texto)
+        if coordenada:
+            pontos.append({'lat': coordenada[0], 'lon': coordenada[1], 'tipo': tipo, 'rotulo': texto.strip()})
+
+    poligono = None
+    if pontos_perimetro.strip():
+        try:
+            poligono = [tuple(p) for p in parsear_pontos(pontos_perimetro).tolist()]
+        except ValueError:
+            st.warning("⚠️ Pontos do perímetro inválidos; o perímetro não será desenhado.")
+
+    if not pontos:
+        st.info("Informe as coordenadas da porteira ou da sede para visualizar o mapa.")
+        return
+    sede = (pontos[-1]['lat'], pontos[-1]['lon'])
+
+    visitas = carregar_visitas_periodo(datetime.now().date() - timedelta(days=365))
+    for _, visita in visitas_proximas(visitas, sede[0], sede[1], excluir_placa=numero_placa).iterrows():
+        pontos.append({'lat': visita['lat_sede'], 'lon': visita['lon_sede'], 'tipo': "Visita anterior",
+                       'rotulo': f"{visita['nome_propriedade']} ({visita['numero_placa']}) - {visita['data_visita']:%d/%m/%Y}"})
+
+    latitudes = [p['lat'] for p in pontos] + [lat for lat, _ in poligono or []]
+    longitudes = [p['lon'] for p in pontos] + [lon for _, lon in poligono or []]
+    margem = 0.002
+    mosaico = montar_mosaico(obter_cache_tiles(), min(latitudes) - margem, min(longitudes) - margem,
+                             max(latitudes) + margem, max(longitudes) + margem, permitir_rede=permitir_rede)
+    st.pydeck_chart(criar_mapa(pontos, poligono, mosaico))
+    if mosaico[3]:
+        st.caption(f"🛰️ {mosaico[3]} parte(s) do mapa fora do cache local"
+                   f"{'' if permitir_rede else '; use 🗺️ Pré-visualizar Mapa para baixá-las'}.")
+
+@st.cache_data(ttl=60, show_spinner=False)
+def carregar_visitas_periodo(desde, ate=None):
+    """Visitas do período, em cache por 60 s: as abas são renderizadas a cada interação."""
+    return carregar_visitas(desde, ate)
+
+def exibir_analises():
+    """Aba de análises: indicadores das visitas registradas no período escolhido."""
+    st.header("📊 Análises do Programa")
+    hoje = datetime.now().date()
+    periodo = st.date_input("Período", value=(hoje - timedelta(days=6), hoje), key="periodo_analises_input")
+    if not isinstance(periodo, (tuple, list)) or len(periodo) != 2:
+        st.info("Selecione a data inicial e a final do período.")
+        return
+
+    visitas = carregar_visitas_periodo(periodo[0], periodo[1])
+    if visitas.empty:
+        st.info("Nenhuma visita registrada no período.")
+        return
+
+    resumo = resumo_geral(visitas)
+    col_visitas, col_propriedades, col_area, col_marca = st.columns(4)
+    col_visitas.metric("Visitas", resumo['visitas'])
+    col_propriedades.metric("Propriedades cadastradas", resumo['propriedades'])
+    col_area.metric("Área total (ha)", f"{resumo['area_total_ha']:.2f}")
+    col_marca.metric("Com marca de gado", resumo['propriedades_com_marca_gado'])
+
+    st.subheader("🗓️ Visitas por semana e município")
+    por_semana = visitas_por_semana(visitas)
+    st.bar_chart(por_semana, x="semana", y="visitas", color="municipio")
+
+    st.subheader("🗺️ Cobertura por município")
+    st.dataframe(cobertura_por_municipio(visitas), hide_index=True, use_container_width=True)
+
+    st.subheader("🐄 Propriedades com marca de gado")
+    st.dataframe(propriedades_com_marca_gado(visitas), hide_index=True, use_container_width=True)
 
 def main():
     st.set_page_config(
@@ -653,10 +973,11 @@ def main():
         st.write("1. **📍 Localização**: Use os botões '🎯 Alta Precisão' ou '⚡ Rápida' para obter coordenadas GPS.")
         st.write("2. Preencha todos os campos obrigatórios.")
         st.write("3. Para as horas, use o formato HH:MM (ex: 08:30, 14:00).")
-        st.write("4. Campos opcionais: veículos e marca de gado.")
+        st.write("4. Campos opcionais: veículos, marca de gado e pontos do perímetro.")
         st.write("5. Clique em '🚀 Gerar Histórico'.")
         st.write("6. O texto será refinado automaticamente pela IA.")
         st.write("7. Use o botão '📋 Copiar Texto Completo' ou '💾 Baixar como TXT'.")
+        st.write("8. '🗺️ Pré-visualizar Mapa' mostra porteira, sede e visitas próximas, mesmo sem sinal.")
         
         st.header("🔧 Dicas de Precisão GPS")
         st.write("📱 **No celular**: Permita acesso à localização quando solicitado pelo navegador.")
@@ -665,179 +986,249 @@ def main():
         st.write("📍 **Posição**: Mantenha o dispositivo relativamente parado durante a captura para melhor precisão.")
         st.write("🔒 **HTTPS**: A geolocalização do navegador geralmente requer conexão segura (HTTPS).")
         
+        st.header("👮 Responsável")
+        responsavel = st.text_input("Policial responsável (posto/graduação, nome e matrícula)", key="responsavel_text",
+                                    help="Registrado no jornal de auditoria junto com cada histórico gerado.")
+
         debug_mode = st.checkbox("🐛 Modo Debug", key="debug_mode_checkbox")
+
+    aba_historico, aba_analises = st.tabs(["📝 Histórico", "📊 Análises"])
+
+    with aba_analises:
+        exibir_analises()
+
+    with aba_historico:
+        # O identificador do rascunho fica na URL, para que qualquer réplica atrás do balanceador o recupere
+        _, rascunhos = obter_estado_compartilhado()
+        if "rascunho" not in st.query_params:
+            st.query_params["rascunho"] = uuid.uuid4().hex
+        id_rascunho = st.query_params["rascunho"]
+        restaurar_rascunho(rascunhos, id_rascunho)
     
-    with st.form("formulario_historico"):
-        col1, col2 = st.columns(2)
+        with st.form("formulario_historico"):
+            col1, col2 = st.columns(2)
         
-        with col1:
-            st.header("📅 Dados da Visita")
-            data_visita = st.date_input("Data da visita", key="data_visita_input")
+            with col1:
+                st.header("📅 Dados da Visita")
+                data_visita = st.date_input("Data da visita", key="data_visita_input")
             
-            hora_inicio_str = time_input_native("Hora de início", key="comp_hora_inicio")
-            hora_fim_str = time_input_native("Hora de término", key="comp_hora_fim")
+                hora_inicio_str = time_input_native("Hora de início", key="comp_hora_inicio")
+                hora_fim_str = time_input_native("Hora de término", key="comp_hora_fim")
             
-            if debug_mode: # Debug inicial dos valores capturados do input nativo
-                st.write(f"🐛 Debug Input - Hora início (raw): '{hora_inicio_str}'")
-                st.write(f"🐛 Debug Input - Hora fim (raw): '{hora_fim_str}'")
+                if debug_mode: # Debug inicial dos valores capturados do input nativo
+                    st.write(f"🐛 Debug Input - Hora início (raw): '{hora_inicio_str}'")
+                    st.write(f"🐛 Debug Input - Hora fim (raw): '{hora_fim_str}'")
             
-            st.header("🏠 Dados da Propriedade")
-            tipo_propriedade = st.selectbox("Tipo de propriedade", ["Sítio", "Fazenda", "Chácara", "Estância"], key="tipo_prop_sel")
-            nome_propriedade = st.text_input("Nome da propriedade", placeholder="Ex: São José", key="nome_prop_text")
-            endereco = st.text_area("Endereço completo", placeholder="Inclua referências se houver", key="endereco_text_area")
-            municipio = st.text_input("Município", key="municipio_text")
-            uf = st.selectbox("UF", ["RO", "AC", "AM", "RR", "PA", "TO", "MT", "MS", "GO", "DF"], key="uf_sel")
+                st.header("🏠 Dados da Propriedade")
+                tipo_propriedade = st.selectbox("Tipo de propriedade", ["Sítio", "Fazenda", "Chácara", "Estância"], key="tipo_prop_sel")
+                nome_propriedade = st.text_input("Nome da propriedade", placeholder="Ex: São José", key="nome_prop_text")
+                endereco = st.text_area("Endereço completo", placeholder="Inclua referências se houver", key="endereco_text_area")
+                municipio = st.text_input("Município", key="municipio_text", help="Se deixado em branco, é preenchido pela coordenada da sede.")
+                uf = st.selectbox("UF", ["RO", "AC", "AM", "RR", "PA", "TO", "MT", "MS", "GO", "DF"], key="uf_sel")
             
-        with col2:
-            st.header("📍 Coordenadas GPS")
-            obter_localizacao() # Componente HTML para GPS
+            with col2:
+                st.header("📍 Coordenadas GPS")
+                obter_localizacao() # Componente HTML para GPS
             
-            lat_long_porteira = st.text_input("Coordenadas da porteira (Lat, Long)", key="lat_long_porteira_input", placeholder="Ex: -9.897289, -63.017788")
-            lat_long_sede = st.text_input("Coordenadas da sede (Lat, Long)", key="lat_long_sede_input", placeholder="Ex: -9.897500, -63.017900")
+                lat_long_porteira = st.text_input("Coordenadas da porteira (Lat, Long)", key="lat_long_porteira_input", placeholder="Ex: -9.897289, -63.017788")
+                lat_long_sede = st.text_input("Coordenadas da sede (Lat, Long)", key="lat_long_sede_input", placeholder="Ex: -9.897500, -63.017900")
+                pontos_perimetro = st.text_area("Pontos do perímetro (Opcional)", key="pontos_perimetro_text_area",
+                                                placeholder="Um ponto por linha, ex:\n-9.897289, -63.017788\n-9.898100, -63.016900",
+                                                help="Use o modo '📐 Perímetro da Propriedade' e cole aqui os pontos copiados.")
             
-            st.header("📏 Área e Proprietário")
-            area = st.number_input("Área da propriedade", min_value=0.01, step=0.1, format="%.2f", key="area_num_input")
-            unidade_area = st.selectbox("Unidade", ["hectares", "alqueires"], key="unidade_area_sel")
-            nome_proprietario = st.text_input("Nome do proprietário", key="nome_proprietario_text")
-            cpf_cnpj = st.text_input("CPF/CNPJ", placeholder="000.000.000-00 ou 00.000.000/0000-00", key="cpf_cnpj_text")
-            telefone = st.text_input("Telefone", placeholder="(69) 99999-9999", key="telefone_text")
+                st.header("📏 Área e Proprietário")
+                area = st.number_input("Área da propriedade", min_value=0.01, step=0.1, format="%.2f", key="area_num_input")
+                unidade_area = st.selectbox("Unidade", ["hectares", "alqueires"], key="unidade_area_sel")
+                nome_proprietario = st.text_input("Nome do proprietário", key="nome_proprietario_text")
+                cpf_cnpj = st.text_input("CPF/CNPJ", placeholder="000.000.000-00 ou 00.000.000/0000-00", key="cpf_cnpj_text")
+                telefone = st.text_input("Telefone", placeholder="(69) 99999-9999", key="telefone_text")
         
-        st.header("💼 Atividade Econômica")
-        atividade_principal = st.text_input("Atividade principal", placeholder="Ex: Criação de bovinos", key="atividade_text")
+            st.header("💼 Atividade Econômica")
+            atividade_principal = st.text_input("Atividade principal", placeholder="Ex: Criação de bovinos", key="atividade_text")
         
-        st.header("🚗 Veículos (Opcional)")
-        veiculos = st.text_area("Descrição dos veículos", 
-                               placeholder="Ex: uma caminhonete marca Ford, modelo Ranger, placa ABC-1234, cor Prata; um trator marca Massey Ferguson, modelo 265, sem placa, cor Vermelha", key="veiculos_text_area")
+            st.header("🚗 Veículos (Opcional)")
+            veiculos = st.text_area("Descrição dos veículos", 
+                                   placeholder="Ex: uma caminhonete marca Ford, modelo Ranger, placa ABC-1234, cor Prata; um trator marca Massey Ferguson, modelo 265, sem placa, cor Vermelha", key="veiculos_text_area")
         
-        st.header("🐄 Rebanho")
-        marca_gado = st.text_input("Marca/sinal/ferro registrado (Opcional)", 
-                                  placeholder="Ex: JB na paleta esquerda", key="marca_gado_text")
+            st.header("🐄 Rebanho")
+            marca_gado = st.text_input("Marca/sinal/ferro registrado (Opcional)", 
+                                      placeholder="Ex: JB na paleta esquerda", key="marca_gado_text")
         
-        st.header("🏷️ Placa de Identificação")
-        numero_placa = st.text_input("Número da placa", placeholder="Ex: PSR-001", key="numero_placa_text")
+            st.header("🏷️ Placa de Identificação")
+            numero_placa = st.text_input("Número da placa", placeholder="Ex: PSR-001", key="numero_placa_text")
         
-        submitted = st.form_submit_button("🚀 Gerar Histórico", use_container_width=True)
+            col_gerar, col_mapa = st.columns([3, 1])
+            with col_gerar:
+                submitted = st.form_submit_button("🚀 Gerar Histórico", use_container_width=True)
+            with col_mapa:
+                pre_visualizar = st.form_submit_button("🗺️ Pré-visualizar Mapa", use_container_width=True)
+
+        # O rascunho é salvo a cada envio, antes da validação, para não perder o preenchimento
+        if submitted or pre_visualizar:
+            salvar_rascunho(rascunhos, id_rascunho, data_visita)
+
+        if pre_visualizar:
+            exibir_mapa(lat_long_porteira, lat_long_sede, pontos_perimetro, numero_placa)
     
-    if submitted:
-        hora_inicio_val_final = hora_inicio_str # Já é .strip() pela função time_input_native
-        hora_fim_val_final = hora_fim_str       # Já é .strip() pela função time_input_native
-
-        if debug_mode:
-            st.write("### 🐛 Debug Detalhado (Após Submit, Antes da Validação)")
-            st.write(f"Hora início (para validação): '{hora_inicio_val_final}', Tipo: {type(hora_inicio_val_final)}, Len: {len(hora_inicio_val_final if hora_inicio_val_final else '')}")
-            st.write(f"Hora fim (para validação): '{hora_fim_val_final}', Tipo: {type(hora_fim_val_final)}, Len: {len(hora_fim_val_final if hora_fim_val_final else '')}")
+        if submitted:
+            hora_inicio_val_final = hora_inicio_str # Já é .strip() pela função time_input_native
+            hora_fim_val_final = hora_fim_str       # Já é .strip() pela função time_input_native
+
+            if debug_mode:
+                st.write("### 🐛 Debug Detalhado (Após Submit, Antes da Validação)")
+                st.write(f"Hora início (para validação): '{hora_inicio_val_final}', Tipo: {type(hora_inicio_val_final)}, Len: {len(hora_inicio_val_final if hora_inicio_val_final else '')}")
+                st.write(f"Hora fim (para validação): '{hora_fim_val_final}', Tipo: {type(hora_fim_val_final)}, Len: {len(hora_fim_val_final if hora_fim_val_final else '')}")
             
-            # Teste regex individual corrigido
-            if hora_inicio_val_final:
-                match_inicio_debug = re.match(r'^\d{1,2}:\d{2}$', hora_inicio_val_final)
-                st.write(f"🐛 Debug Regex match início ('{hora_inicio_val_final}'): {match_inicio_debug is not None}")
-            else:
-                st.write(f"🐛 Debug Regex match início: String vazia, não testado.")
+                # Teste regex individual corrigido
+                if hora_inicio_val_final:
+                    match_inicio_debug = re.match(r'^\d{1,2}:\d{2}$', hora_inicio_val_final)
+                    st.write(f"🐛 Debug Regex match início ('{hora_inicio_val_final}'): {match_inicio_debug is not None}")
+                else:
+                    st.write(f"🐛 Debug Regex match início: String vazia, não testado.")
             
-            if hora_fim_val_final:
-                match_fim_debug = re.match(r'^\d{1,2}:\d{2}$', hora_fim_val_final)
-                st.write(f"🐛 Debug Regex match fim ('{hora_fim_val_final}'): {match_fim_debug is not None}")
-            else:
-                st.write(f"🐛 Debug Regex match fim: String vazia, não testado.")
-
-        campos_obrigatorios_dict = {
-            "Data da visita": data_visita,
-            "Hora de início": hora_inicio_val_final, 
-            "Hora de término": hora_fim_val_final,   
-            "Nome da propriedade": nome_propriedade,
-            "Endereço completo": endereco,
-            "Município": municipio,
-            "Coordenadas da porteira": lat_long_porteira,
-            "Coordenadas da sede": lat_long_sede,
-            "Área da propriedade": area, 
-            "Nome do proprietário": nome_proprietario,
-            "CPF/CNPJ": cpf_cnpj,
-            "Telefone": telefone,
-            "Atividade principal": atividade_principal,
-            "Número da placa": numero_placa
-        }
-        
-        campos_vazios_nomes = []
-        for nome, valor in campos_obrigatorios_dict.items():
-            if isinstance(valor, str) and not valor.strip(): # Checa strings vazias ou só com espaços
-                campos_vazios_nomes.append(nome)
-            elif valor is None: # Checa None para campos não-string (como data_visita, area)
-                 if nome == "Área da propriedade" and (area is None or area <=0) : 
-                     if nome not in campos_vazios_nomes: campos_vazios_nomes.append(nome + " (deve ser > 0)")
-                 elif nome != "Área da propriedade": 
-                     campos_vazios_nomes.append(nome)
-        
-        if area is None or area <= 0: # Garantir que a área seja validada mesmo se não for None, mas <=0
-            if "Área da propriedade (deve ser > 0)" not in campos_vazios_nomes and \
-               "Área da propriedade" not in campos_vazios_nomes :
-                 campos_vazios_nomes.append("Área da propriedade (deve ser > 0)")
-
-        erros_formato_hora = []
-        if not hora_inicio_val_final: # Adicionado para checar se o campo obrigatório de hora está vazio
-            if "Hora de início" not in campos_vazios_nomes: campos_vazios_nomes.append("Hora de início")
-        elif not validar_formato_hora_strptime(hora_inicio_val_final):
-            erros_formato_hora.append("Hora de início")
-        
-        if not hora_fim_val_final: # Adicionado para checar se o campo obrigatório de hora está vazio
-            if "Hora de término" not in campos_vazios_nomes: campos_vazios_nomes.append("Hora de término")
-        elif not validar_formato_hora_strptime(hora_fim_val_final):
-            erros_formato_hora.append("Hora de término")
-
-        if campos_vazios_nomes:
-            # Remover duplicatas e ordenar para mensagem de erro clara
-            unique_campos_vazios = sorted(list(set(campos_vazios_nomes)))
-            st.error(f"❌ Por favor, preencha todos os campos obrigatórios: {', '.join(unique_campos_vazios)}!")
-        elif erros_formato_hora:
-            st.error(f"❌ Formato de hora inválido para: {', '.join(erros_formato_hora)}. Use o formato HH:MM e valores válidos (ex: 08:30).")
-            if debug_mode:
-                st.error(f"🐛 Debug Valores Hora para Validação - Início: '{hora_inicio_val_final}', Fim: '{hora_fim_val_final}'")
-        else:
-            dados = {
-                'data': data_visita.strftime("%d/%m/%Y"),
-                'hora_inicio': hora_inicio_val_final, 
-                'hora_fim': hora_fim_val_final,     
-                'tipo_propriedade': tipo_propriedade,
-                'nome_propriedade': nome_propriedade,
-                'endereco': endereco,
-                'municipio': municipio,
-                'uf': uf,
-                'lat_long_porteira': lat_long_porteira,
-                'lat_long_sede': lat_long_sede,
-                'area': f"{area:.2f}", 
-                'unidade_area': unidade_area,
-                'nome_proprietario': nome_proprietario,
-                'cpf_cnpj': cpf_cnpj,
-                'telefone': telefone,
-                'atividade_principal': atividade_principal,
-                'veiculos': veiculos if veiculos.strip() else "", # Garante que não passe só espaços
-                'marca_gado': marca_gado if marca_gado.strip() else "", # Garante que não passe só espaços
-                'numero_placa': numero_placa
+                if hora_fim_val_final:
+                    match_fim_debug = re.match(r'^\d{1,2}:\d{2}$', hora_fim_val_final)
+                    st.write(f"🐛 Debug Regex match fim ('{hora_fim_val_final}'): {match_fim_debug is not None}")
+                else:
+                    st.write(f"🐛 Debug Regex match fim: String vazia, não testado.")
+
+            # Confere município/UF pela coordenada da sede (preenche o município se estiver vazio)
+            indice_municipios = carregar_indice_municipios()
+            if indice_municipios is not None and lat_long_sede.strip():
+                try:
+                    municipio_encontrado, divergencias_municipio = conferir_municipio(indice_municipios, lat_long_sede, municipio, uf)
+                except ValueError:
+                    municipio_encontrado, divergencias_municipio = None, []
+                if municipio_encontrado is not None:
+                    if not municipio.strip():
+                        municipio = municipio_encontrado["nome"]
+                        uf = municipio_encontrado["uf"] or uf
+                        st.info(f"📍 Município preenchido pela coordenada da sede: {municipio}/{uf}")
+                    elif divergencias_municipio:
+                        st.warning(f"⚠️ {' e '.join(divergencias_municipio)} informado(s) ({municipio}/{uf}) não corresponde(m) à coordenada da sede, que fica em {municipio_encontrado['nome']}/{municipio_encontrado['uf']}. Confira os dados.")
+
+            campos_obrigatorios_dict = {
+                "Data da visita": data_visita,
+                "Hora de início": hora_inicio_val_final, 
+                "Hora de término": hora_fim_val_final,   
+                "Nome da propriedade": nome_propriedade,
+                "Endereço completo": endereco,
+                "Município": municipio,
+                "Coordenadas da porteira": lat_long_porteira,
+                "Coordenadas da sede": lat_long_sede,
+                "Área da propriedade": area, 
+                "Nome do proprietário": nome_proprietario,
+                "CPF/CNPJ": cpf_cnpj,
+                "Telefone": telefone,
+                "Atividade principal": atividade_principal,
+                "Número da placa": numero_placa
             }
+        
+            campos_vazios_nomes, erros_formato_hora = validar_campos(
+                campos_obrigatorios_dict, hora_inicio_val_final, hora_fim_val_final, area
+            )
+
+            perimetro = None
+            erro_perimetro = None
+            if pontos_perimetro.strip():
+                try:
+                    perimetro = calcular_area_perimetro(parsear_pontos(pontos_perimetro))
+                except ValueError as e:
+                    erro_perimetro = str(e)
+
+            if campos_vazios_nomes:
+                # Remover duplicatas e ordenar para mensagem de erro clara
+                unique_campos_vazios = sorted(list(set(campos_vazios_nomes)))
+                st.error(f"❌ Por favor, preencha todos os campos obrigatórios: {', '.join(unique_campos_vazios)}!")
+            elif erros_formato_hora:
+                st.error(f"❌ Formato de hora inválido para: {', '.join(erros_formato_hora)}. Use o formato HH:MM e valores válidos (ex: 08:30).")
+                if debug_mode:
+                    st.error(f"🐛 Debug Valores Hora para Validação - Início: '{hora_inicio_val_final}', Fim: '{hora_fim_val_final}'")
+            elif erro_perimetro:
+                st.error(f"❌ Pontos do perímetro inválidos: {erro_perimetro}")
+            else:
+                dados = {
+                    'data': data_visita.strftime("%d/%m/%Y"),
+                    'hora_inicio': hora_inicio_val_final, 
+                    'hora_fim': hora_fim_val_final,     
+                    'tipo_propriedade': tipo_propriedade,
+                    'nome_propriedade': nome_propriedade,
+                    'endereco': endereco,
+                    'municipio': municipio,
+                    'uf': uf,
+                    'lat_long_porteira': lat_long_porteira,
+                    'lat_long_sede': lat_long_sede,
+                    'area': f"{area:.2f}", 
+                    'unidade_area': unidade_area,
+                    'nome_proprietario': nome_proprietario,
+                    'cpf_cnpj': cpf_cnpj,
+                    'telefone': telefone,
+                    'atividade_principal': atividade_principal,
+                    'veiculos': veiculos if veiculos.strip() else "", # Garante que não passe só espaços
+                    'marca_gado': marca_gado if marca_gado.strip() else "", # Garante que não passe só espaços
+                    'numero_placa': numero_placa
+                }
+
+                if perimetro:
+                    adicionar_perimetro(dados, perimetro)
+
+                    area_declarada_ha = converter_para_hectares(area, unidade_area)
+                    discrepancia = verificar_discrepancia_area(area_declarada_ha, perimetro['area_ha'])
+                    st.info(f"📐 Área calculada pelo perímetro: {perimetro['area_ha']:.2f} ha | Perímetro: {perimetro['perimetro_m']:.0f} m | {perimetro['num_pontos']} pontos")
+                    if discrepancia is not None:
+                        st.warning(f"⚠️ A área declarada ({area_declarada_ha:.2f} ha) difere {discrepancia:+.0%} da área calculada pelo perímetro ({perimetro['area_ha']:.2f} ha). Confira os dados com o proprietário.")
            
-            with st.spinner("🔄 Gerando histórico..."):
-                historico_bruto = gerar_historico(dados)
+                with st.spinner("🔄 Gerando histórico..."):
+                    inicio_geracao = time.perf_counter()
+                    historico_bruto = gerar_historico(dados)
+                    tempo_geracao_ms = (time.perf_counter() - inicio_geracao) * 1000
            
-            with st.spinner("✨ Refinando texto com IA..."):
-                historico_refinado = refinar_texto_com_openai(historico_bruto)
+                with st.spinner("✨ Refinando texto com IA..."):
+                    inicio_refinamento = time.perf_counter()
+                    historico_refinado = refinar_texto_com_openai(historico_bruto)
+                    tempo_refinamento_ms = (time.perf_counter() - inicio_refinamento) * 1000
+
+                obter_jornal_auditoria().registrar({
+                    'origem': "app",
+                    'responsavel': responsavel.strip(),
+                    'entrada': dict(dados, pontos_perimetro=pontos_perimetro),
+                    'historico': historico_bruto,
+                    'refinado': historico_refinado,
+                    'alterado_pela_ia': historico_refinado != historico_bruto,
+                    'tempos_ms': {'geracao': round(tempo_geracao_ms, 3), 'refinamento': round(tempo_refinamento_ms, 1)},
+                })
            
-            st.success("✅ Histórico gerado com sucesso!")
+                # Falhas nas análises (disco, pyarrow) nunca impedem a entrega do histórico
+                try:
+                    registrar_visita(dados)
+                    carregar_visitas_periodo.clear()
+                except Exception as e:
+                    st.warning(f"⚠️ Não foi possível registrar a visita para as análises: {str(e)}")
+
+                # Histórico gerado: o rascunho não é mais necessário
+                rascunhos.remover(id_rascunho)
+
+                st.success("✅ Histórico gerado com sucesso!")
            
-            st.header("📄 Histórico Final")
-            st.text_area("Texto gerado:", value=historico_refinado, height=400, key="historico_final_text_area_display_unique", disabled=True) 
+                st.header("📄 Histórico Final")
+                st.text_area("Texto gerado:", value=historico_refinado, height=400, key="historico_final_text_area_display_unique", disabled=True) 
                        
-            col_copy, col_download = st.columns(2)
+                col_copy, col_download = st.columns(2)
            
-            with col_copy:
-                criar_botao_copiar(historico_refinado)
+                with col_copy:
+                    criar_botao_copiar(historico_refinado)
            
-            with col_download:
-                st.download_button(
-                    label="💾 Baixar como TXT",
-                    data=historico_refinado,
-                    file_name=f"historico_policial_{data_visita.strftime('%Y%m%d')}_{nome_propriedade.replace(' ','_') if nome_propriedade else 'desconhecido'}.txt",
-                    mime="text/plain",
-                    use_container_width=True
-                )
+                with col_download:
+                    st.download_button(
+                        label="💾 Baixar como TXT",
+                        data=historico_refinado,
+                        file_name=f"historico_policial_{data_visita.strftime('%Y%m%d')}_{nome_propriedade.replace(' ','_') if nome_propriedade else 'desconhecido'}.txt",
+                        mime="text/plain",
+                        use_container_width=True
+                    )
+
+                # Após gerar, só o cache local: buscar tiles na rede atrasaria a entrega do histórico
+                exibir_mapa(lat_long_porteira, lat_long_sede, pontos_perimetro, numero_placa, permitir_rede=False)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
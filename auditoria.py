@@ -0,0 +1,207 @@
+import argparse
+import atexit
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+import zlib
+from datetime import datetime
+
+from travas import travar_arquivo
+
+# Jornal de auditoria somente-acréscimo de cada histórico gerado.
+# Os eventos são gravados por uma thread em segundo plano, em lotes; cada lote vira um membro
+# gzip acrescentado ao segmento atual (dados/auditoria/AAAA-MM-DD-NNNN.jsonl.gz). O segmento é
+# rotacionado por tamanho e por dia. O arquivo indice.jsonl aponta, para cada evento, a data,
+# a placa, o segmento e a posição do membro gzip, permitindo reler só o necessário.
+# Vários processos (app, API, réplicas) podem gravar no mesmo diretório: a escolha do segmento, o
+# acréscimo e a atualização do índice ocorrem sob uma trava de arquivo em .trava.
+
+DIRETORIO_AUDITORIA_PADRAO = os.environ.get("AUDITORIA_PATH", os.path.join("dados", "auditoria"))
+TAMANHO_MAXIMO_SEGMENTO = 16 * 1024 * 1024
+INTERVALO_LOTE_S = 0.5
+TAMANHO_MAXIMO_LOTE = 256
+NIVEL_COMPRESSAO = 6
+
+_PADRAO_SEGMENTO = re.compile(r"^(\d{4}-\d{2}-\d{2})-(\d{4})\.jsonl\.gz$")
+
+
+def _comprimir_membro(conteudo: bytes) -> bytes:
+    compressor = zlib.compressobj(NIVEL_COMPRESSAO, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    return compressor.compress(conteudo) + compressor.flush()
+
+
+def _ler_membro(arquivo, posicao):
+    """Descomprime um único membro gzip a partir da posição informada."""
+    arquivo.seek(posicao)
+    descompressor = zlib.decompressobj(31)
+    partes = []
+    while not descompressor.eof:
+        bloco = arquivo.read(64 * 1024)
+        if not bloco:
+            break
+        partes.append(descompressor.decompress(bloco))
+    return b"".join(partes)
+
+
+class JornalAuditoria:
+    """Jornal de auditoria assíncrono; registrar() apenas enfileira o evento."""
+
+    def __init__(self, diretorio=DIRETORIO_AUDITORIA_PADRAO, tamanho_segmento=TAMANHO_MAXIMO_SEGMENTO,
+                 intervalo_lote=INTERVALO_LOTE_S, tamanho_lote=TAMANHO_MAXIMO_LOTE):
+        self.diretorio = diretorio
+        self.tamanho_segmento = tamanho_segmento
+        self.intervalo_lote = intervalo_lote
+        self.tamanho_lote = tamanho_lote
+        self._fila = queue.Queue()
+        self._encerrar = threading.Event()
+        self._segmento = None
+        self._lock_leitura = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+        self._caminho_trava = os.path.join(diretorio, ".trava")
+
+        self._thread = threading.Thread(target=self._gravar_continuamente, name="jornal-auditoria", daemon=True)
+        self._thread.start()
+        atexit.register(self.fechar)
+
+    def registrar(self, evento: dict):
+        """Enfileira um evento para gravação; completa id e horário de registro se ausentes."""
+        evento.setdefault("id", uuid.uuid4().hex)
+        evento.setdefault("registrado_em", datetime.now().isoformat(timespec="seconds"))
+        self._fila.put(evento)
+
+    def fechar(self, timeout=5.0):
+        """Grava os eventos pendentes e encerra a thread de gravação."""
+        if self._thread.is_alive():
+            self._encerrar.set()
+            self._thread.join(timeout)
+
+    def _proximo_segmento(self, dia):
+        sequencias = [int(m.group(2)) for m in map(_PADRAO_SEGMENTO.match, os.listdir(self.diretorio))
+                      if m and m.group(1) == dia]
+        atual = max(sequencias, default=0)
+        caminho = os.path.join(self.diretorio, f"{dia}-{atual:04d}.jsonl.gz")
+        if atual and os.path.getsize(caminho) < self.tamanho_segmento:
+            return caminho
+        return os.path.join(self.diretorio, f"{dia}-{atual + 1:04d}.jsonl.gz")
+
+    def _gravar_continuamente(self):
+        # A thread acorda só a cada intervalo_lote e drena a fila de uma vez: acordar a cada evento
+        # disputaria o GIL com o caminho de envio do formulário/API.
+        while True:
+            encerrar = self._encerrar.wait(self.intervalo_lote)
+            lote = []
+            while True:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            for inicio in range(0, len(lote), self.tamanho_lote):
+                # Qualquer exceção é capturada: a thread não pode morrer, senão os eventos seguintes
+                # ficariam na fila sem nunca serem gravados
+                parte = lote[inicio:inicio + self.tamanho_lote]
+                try:
+                    self._gravar_lote(parte)
+                except Exception as e:
+                    print(f"Falha ao gravar lote de {len(parte)} eventos no jornal de auditoria: {e!r}", file=sys.stderr)
+            if encerrar:
+                return
+
+    def _serializar(self, lote):
+        """Linhas JSON e entradas de índice do lote; eventos que não serializam são descartados com aviso."""
+        linhas, entradas = [], []
+        for evento in lote:
+            try:
+                linha = json.dumps(evento, ensure_ascii=False, default=str) + "\n"
+                entrada = {
+                    "data": str(evento["registrado_em"])[:10],
+                    "placa": str((evento.get("entrada") or {}).get("numero_placa") or "").strip().upper(),
+                    "id": str(evento["id"]),
+                }
+            except Exception as e:
+                print(f"Evento {evento.get('id')} descartado do jornal de auditoria: {e!r}", file=sys.stderr)
+                continue
+            linhas.append(linha)
+            entradas.append(entrada)
+        return linhas, entradas
+
+    def _gravar_lote(self, lote):
+        # Eventos problemáticos são isolados antes da gravação: o segmento e o índice são escritos uma
+        # única vez por lote, sem repetição que deixaria membros duplicados fora do índice
+        linhas, entradas = self._serializar(lote)
+        if not linhas:
+            return
+        membro = _comprimir_membro("".join(linhas).encode("utf-8"))
+
+        with self._lock_leitura, travar_arquivo(self._caminho_trava):
+            # A trava de arquivo cobre outros processos: sem ela, um acréscimo alheio entre tell() e
+            # write() deixaria uma posição errada no índice
+            dia = datetime.now().strftime("%Y-%m-%d")
+            if (self._segmento is None or not os.path.basename(self._segmento).startswith(dia)
+                    or not os.path.exists(self._segmento)
+                    or os.path.getsize(self._segmento) >= self.tamanho_segmento):
+                self._segmento = self._proximo_segmento(dia)
+
+            with open(self._segmento, "ab") as arquivo:
+                posicao = arquivo.tell()
+                arquivo.write(membro)
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+
+            segmento = os.path.basename(self._segmento)
+            linhas = "".join(json.dumps(dict(entrada, segmento=segmento, posicao=posicao), ensure_ascii=False) + "\n"
+                             for entrada in entradas)
+            with open(os.path.join(self.diretorio, "indice.jsonl"), "a", encoding="utf-8") as indice:
+                indice.write(linhas)
+                indice.flush()
+                os.fsync(indice.fileno())
+
+    def ler(self, data=None, placa=None):
+        """Relê os eventos gravados, filtrando por data de registro (AAAA-MM-DD) e/ou placa."""
+        placa = placa.strip().upper() if placa else None
+        caminho_indice = os.path.join(self.diretorio, "indice.jsonl")
+        if not os.path.exists(caminho_indice):
+            return []
+
+        with self._lock_leitura, travar_arquivo(self._caminho_trava, exclusiva=False):
+            membros = {}
+            ids = set()
+            with open(caminho_indice, encoding="utf-8") as indice:
+                for linha in indice:
+                    entrada = json.loads(linha)
+                    if (data and entrada["data"] != data) or (placa and entrada["placa"] != placa):
+                        continue
+                    membros.setdefault(entrada["segmento"], set()).add(entrada["posicao"])
+                    ids.add(entrada["id"])
+
+            eventos = []
+            for segmento, posicoes in sorted(membros.items()):
+                with open(os.path.join(self.diretorio, segmento), "rb") as arquivo:
+                    for posicao in sorted(posicoes):
+                        for linha in _ler_membro(arquivo, posicao).splitlines():
+                            evento = json.loads(linha)
+                            if evento["id"] in ids:
+                                eventos.append(evento)
+        return eventos
+
+
+def main(argv=None):
+    """Imprime os eventos do jornal de auditoria em JSON, um por linha."""
+    parser = argparse.ArgumentParser(description="Consulta o jornal de auditoria")
+    parser.add_argument("--data")
+    parser.add_argument("--placa")
+    parser.add_argument("--diretorio", default=DIRETORIO_AUDITORIA_PADRAO)
+    args = parser.parse_args(argv)
+
+    jornal = JornalAuditoria(args.diretorio)
+    for evento in jornal.ler(args.data, args.placa):
+        print(json.dumps(evento, ensure_ascii=False))
+    jornal.fechar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import json
+import time
+
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+# Gerador de carga local para a API (api.py). Exemplo:
+#   python api.py --porta 8502 &
+#   python bench_api.py --url http://localhost:8502/v1/historico?refinar=0 --requisicoes 5000 --concorrencia 50
+
+ENTRADA_EXEMPLO = {
+    "data": "15/05/2025",
+    "hora_inicio": "08:30",
+    "hora_fim": "09:15",
+    "tipo_propriedade": "Sítio",
+    "nome_propriedade": "São José",
+    "endereco": "Linha C-70, Km 12",
+    "municipio": "Ariquemes",
+    "uf": "RO",
+    "lat_long_porteira": "-9.897289, -63.017788",
+    "lat_long_sede": "-9.897500, -63.017900",
+    "area": 48.4,
+    "unidade_area": "hectares",
+    "nome_proprietario": "José da Silva",
+    "cpf_cnpj": "000.000.000-00",
+    "telefone": "(69) 99999-9999",
+    "atividade_principal": "Criação de bovinos",
+    "veiculos": "",
+    "marca_gado": "JS na paleta esquerda",
+    "numero_placa": "PSR-001",
+}
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    indice = min(len(valores_ordenados) - 1, int(round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[indice]
+
+
+async def executar(url, requisicoes, concorrencia, corpo):
+    # max_clients limita as conexões simultâneas; o cliente reaproveita conexões (keep-alive)
+    AsyncHTTPClient.configure(None, max_clients=concorrencia)
+    cliente = AsyncHTTPClient()
+    latencias = []
+    status = {}
+    restantes = iter(range(requisicoes))
+
+    async def trabalhador():
+        for _ in restantes:
+            inicio = time.perf_counter()
+            try:
+                resposta = await cliente.fetch(url, method="POST", body=corpo,
+                                               headers={"Content-Type": "application/json"}, raise_error=False)
+                codigo = resposta.code
+            except HTTPClientError as e:
+                codigo = e.code
+            latencias.append(time.perf_counter() - inicio)
+            status[codigo] = status.get(codigo, 0) + 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+    duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    print(f"Requisições: {requisicoes} | Concorrência: {concorrencia} | Duração: {duracao:.2f}s")
+    print(f"Vazão: {requisicoes / duracao:.0f} req/s")
+    print(f"Latência p50: {percentil(latencias, 50) * 1000:.1f} ms | p95: {percentil(latencias, 95) * 1000:.1f} ms"
+          f" | p99: {percentil(latencias, 99) * 1000:.1f} ms")
+    print(f"Status HTTP: {dict(sorted(status.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga para a API do Gerador de Histórico")
+    parser.add_argument("--url", default="http://localhost:8502/v1/historico?refinar=0")
+    parser.add_argument("--requisicoes", type=int, default=5000)
+    parser.add_argument("--concorrencia", type=int, default=50)
+    parser.add_argument("--lote", type=int, default=0, help="Envia lotes de N entradas (usar com /v1/lote)")
+    args = parser.parse_args()
+
+    if args.lote:
+        corpo = json.dumps({"entradas": [ENTRADA_EXEMPLO] * args.lote, "refinar": False})
+    else:
+        corpo = json.dumps(ENTRADA_EXEMPLO)
+    asyncio.run(executar(args.url, args.requisicoes, args.concorrencia, corpo))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import multiprocessing
+import threading
+import time
+import uuid
+
+from api import FilaRefinamento
+from estado import CacheRefinamento, EstadoRedis, ServidorRespLocal
+from nucleo import gerar_historico, montar_dados
+from replay import ClienteSimulado
+
+# Benchmark de múltiplas réplicas da API compartilhando o estado por protocolo Redis.
+# Cada réplica é um processo com a FilaRefinamento da API (fila de trabalhos compartilhada, fila
+# de respostas própria, cache compartilhado) e um cliente simulado no lugar da OpenAI (latência
+# fixa). As requisições chegam todas à réplica 0 (--entrada uma) ou em rodízio (--entrada rodizio):
+# no primeiro caso, qualquer ganho com mais réplicas vem de workers de outras réplicas consumindo
+# a fila compartilhada e devolvendo a resposta à réplica 0. Sem --estado, sobe um
+# ServidorRespLocal no próprio processo. Exemplo:
+#   python bench_replicas.py --replicas 1 2 4 --trabalhos 800 --distintos 400
+
+ENTRADA_BASE = {
+    "data": "15/05/2025",
+    "hora_inicio": "08:30",
+    "hora_fim": "09:15",
+    "tipo_propriedade": "Sítio",
+    "endereco": "Linha C-70, Km 12",
+    "municipio": "Ariquemes",
+    "uf": "RO",
+    "lat_long_porteira": "-9.897289, -63.017788",
+    "lat_long_sede": "-9.897500, -63.017900",
+    "area": 48.4,
+    "unidade_area": "hectares",
+    "cpf_cnpj": "000.000.000-00",
+    "telefone": "(69) 99999-9999",
+    "atividade_principal": "Criação de bovinos",
+    "veiculos": "",
+    "marca_gado": "",
+}
+
+
+class CacheComAutoria(CacheRefinamento):
+    """Cache que conta os trabalhos atendidos pela réplica e distingue acertos gravados por outra."""
+
+    def __init__(self, backend, prefixo):
+        super().__init__(backend, prefixo=prefixo)
+        self.gravadas = set()
+        self.consultas = 0
+        self.acertos = 0
+        self.acertos_outras_replicas = 0
+        self._lock = threading.Lock()
+
+    def obter(self, parametros):
+        valor = super().obter(parametros)
+        with self._lock:
+            # Todo trabalho atendido por um worker desta réplica passa por aqui uma vez
+            self.consultas += 1
+            if valor is not None:
+                self.acertos += 1
+                if self.chave(parametros) not in self.gravadas:
+                    self.acertos_outras_replicas += 1
+        return valor
+
+    def guardar(self, parametros, refinado):
+        with self._lock:
+            self.gravadas.add(self.chave(parametros))
+        super().guardar(parametros, refinado)
+
+
+def replica(url, prefixo, workers, latencia, tamanho_fila, concorrencia, textos, inicio, fim, resultados):
+    async def principal():
+        backend = EstadoRedis.da_url(url)
+        cache = CacheComAutoria(backend, prefixo=f"{prefixo}:refinamento")
+        cliente = ClienteSimulado(latencia)
+        fila = FilaRefinamento(cliente, backend, tamanho=tamanho_fila, workers=workers, cache=cache,
+                               nome=f"{prefixo}:trabalhos")
+        limite = asyncio.Semaphore(concorrencia)
+        recusadas = 0
+
+        async def requisicao(texto):
+            # Como um cliente que respeita o Retry-After do 503, com espera curta
+            nonlocal recusadas
+            async with limite:
+                while True:
+                    try:
+                        futuro, = await fila.enfileirar([texto])
+                        break
+                    except asyncio.QueueFull:
+                        recusadas += 1
+                        await asyncio.sleep(0.01)
+                await futuro
+
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, inicio.wait)
+        await asyncio.gather(*(requisicao(texto) for texto in textos))
+        # Os workers seguem atendendo as outras réplicas até todas terminarem
+        await loop.run_in_executor(None, fim.wait)
+        fila.encerrar()
+        resultados.put({
+            "recebidos": len(textos),
+            "atendidos": cache.consultas,
+            "recusadas": recusadas,
+            "chamadas_llm": cliente.chamadas,
+            "acertos": cache.acertos,
+            "acertos_outras_replicas": cache.acertos_outras_replicas,
+        })
+
+    asyncio.run(principal())
+
+
+def gerar_textos(trabalhos, distintos):
+    textos = []
+    for indice in range(distintos):
+        dados, _ = montar_dados(dict(ENTRADA_BASE, nome_propriedade=f"Propriedade {indice}",
+                                     nome_proprietario=f"Proprietário {indice}", numero_placa=f"PSR-{indice:03d}"))
+        textos.append(gerar_historico(dados))
+    return [textos[i % distintos] for i in range(trabalhos)]
+
+
+def executar_rodada(url, replicas, textos, entrada, workers, latencia, tamanho_fila, concorrencia_por_replica):
+    prefixo = f"bench:{uuid.uuid4().hex[:8]}"
+    if entrada == "uma":
+        cotas = [textos] + [[] for _ in range(replicas - 1)]
+    else:
+        cotas = [textos[i::replicas] for i in range(replicas)]
+    # Mesmo total de requisições simultâneas nos dois modos
+    concorrencia = concorrencia_por_replica * replicas if entrada == "uma" else concorrencia_por_replica
+
+    inicio = multiprocessing.Barrier(replicas + 1)
+    fim = multiprocessing.Barrier(replicas + 1)
+    resultados = multiprocessing.Queue()
+    processos = [multiprocessing.Process(target=replica, args=(url, prefixo, workers, latencia, tamanho_fila,
+                                                               concorrencia, cota, inicio, fim, resultados))
+                 for cota in cotas]
+    for processo in processos:
+        processo.start()
+    inicio.wait()
+    comeco = time.perf_counter()
+    fim.wait()
+    duracao = time.perf_counter() - comeco
+    parciais = [resultados.get() for _ in processos]
+    for processo in processos:
+        processo.join()
+
+    acertos = sum(p["acertos"] for p in parciais)
+    atendidos = sum(p["atendidos"] for p in parciais)
+    return {
+        "replicas": replicas,
+        "processados": atendidos,
+        "duracao": duracao,
+        "vazao": len(textos) / duracao,
+        "chamadas_llm": sum(p["chamadas_llm"] for p in parciais),
+        "recusadas": sum(p["recusadas"] for p in parciais),
+        "taxa_acerto": acertos / len(textos),
+        "fracao_outras_replicas": sum(p["acertos_outras_replicas"] for p in parciais) / acertos if acertos else 0.0,
+        # Só com todas as requisições na réplica 0 se sabe exatamente quem atendeu trabalho alheio
+        "atendidos_outras_replicas": (sum(p["atendidos"] for p in parciais if not p["recebidos"]) / atendidos
+                                      if entrada == "uma" and atendidos else None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de réplicas da API com estado compartilhado")
+    parser.add_argument("--estado", help="redis://host:porta/db (padrão: substituto local)")
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--trabalhos", type=int, default=400)
+    parser.add_argument("--distintos", type=int, default=100, help="Entradas distintas no corpus")
+    parser.add_argument("--entrada", choices=("uma", "rodizio"), default="uma",
+                        help="uma: todas as requisições chegam à réplica 0; rodizio: divididas entre as réplicas")
+    parser.add_argument("--threads", type=int, default=4, help="Workers de refinamento por réplica")
+    parser.add_argument("--concorrencia", type=int, default=8, help="Requisições simultâneas por réplica")
+    parser.add_argument("--tamanho-fila", type=int, default=64)
+    parser.add_argument("--latencia", type=float, default=0.2, help="Latência simulada da IA (s)")
+    args = parser.parse_args()
+
+    url = args.estado
+    if not url:
+        servidor = ServidorRespLocal()
+        servidor.iniciar_em_thread()
+        url = servidor.url
+
+    textos = gerar_textos(args.trabalhos, args.distintos)
+    base = None
+    print(f"{'Réplicas':>8} {'Vazão (trab/s)':>15} {'Escala':>7} {'Chamadas IA':>12} {'Acerto cache':>13}"
+          f" {'De outra réplica':>17} {'Atendidos por outra':>20}")
+    for replicas in args.replicas:
+        r = executar_rodada(url, replicas, textos, args.entrada, args.threads, args.latencia,
+                            args.tamanho_fila, args.concorrencia)
+        base = base or r["vazao"] / r["replicas"]
+        atendidos = "-" if r["atendidos_outras_replicas"] is None else f"{r['atendidos_outras_replicas']:.0%}"
+        print(f"{r['replicas']:>8} {r['vazao']:>15.1f} {r['vazao'] / base:>6.2f}x {r['chamadas_llm']:>12}"
+              f" {r['taxa_acerto']:>12.0%} {r['fracao_outras_replicas']:>16.0%} {atendidos:>20}")
+
+
+if __name__ == "__main__":
+    main()
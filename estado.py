@@ -0,0 +1,483 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+# Estado compartilhado entre réplicas: cache de refinamento, fila de trabalhos e rascunhos.
+# ESTADO_URL escolhe o backend: "memoria://" (padrão, só o processo atual) ou
+# "redis://host:porta/db" (qualquer servidor que fale o protocolo Redis/RESP).
+
+logger = logging.getLogger(__name__)
+
+URL_ESTADO_PADRAO = os.environ.get("ESTADO_URL", "memoria://")
+
+TTL_CACHE_REFINAMENTO = 7 * 24 * 3600
+TTL_RASCUNHO = 24 * 3600
+# Intervalo mínimo entre varreduras de chaves expiradas no EstadoMemoria
+INTERVALO_LIMPEZA_S = 60
+# Após falhar ao conectar, o EstadoRedis não tenta de novo por este tempo (evita esperar timeouts)
+PAUSA_APOS_FALHA_CONEXAO_S = 10
+
+# Dados pessoais do proprietário nunca vão para o rascunho: quem tiver a URL pode lê-lo
+CAMPOS_FORA_DO_RASCUNHO = ("nome_proprietario", "cpf_cnpj", "telefone")
+
+
+class BackendEstado:
+    """Interface mínima de armazenamento chave-valor com filas, no estilo do Redis."""
+
+    def obter(self, chave):
+        raise NotImplementedError
+
+    def definir(self, chave, valor, ttl=None):
+        raise NotImplementedError
+
+    def remover(self, chave):
+        raise NotImplementedError
+
+    def incrementar(self, chave):
+        raise NotImplementedError
+
+    def expirar(self, chave, ttl):
+        """Define a expiração de uma chave ou fila existente."""
+        raise NotImplementedError
+
+    def enfileirar(self, fila, valor):
+        raise NotImplementedError
+
+    def desenfileirar(self, fila, timeout=0):
+        """Retira o item mais antigo da fila, aguardando até `timeout` segundos (0 = não espera)."""
+        raise NotImplementedError
+
+    def tamanho_fila(self, fila):
+        raise NotImplementedError
+
+
+class ErroRedis(Exception):
+    pass
+
+
+# Falhas do backend (conexão recusada, timeout, erro do servidor). Quem usa o estado como cache ou
+# rascunho deve tratá-las e seguir sem ele.
+ERROS_BACKEND = (OSError, ErroRedis)
+
+
+class EstadoMemoria(BackendEstado):
+    """Backend em memória do processo; adequado para uma única réplica."""
+
+    def __init__(self):
+        self._valores = {}
+        self._expiracoes = {}
+        self._filas = {}
+        self._lock = threading.Lock()
+        self._condicao = threading.Condition(self._lock)
+        self._proxima_limpeza = time.monotonic() + INTERVALO_LIMPEZA_S
+
+    def _expirado(self, chave):
+        expira = self._expiracoes.get(chave)
+        if expira is not None and expira <= time.monotonic():
+            self._valores.pop(chave, None)
+            self._filas.pop(chave, None)
+            self._expiracoes.pop(chave, None)
+            return True
+        return False
+
+    def _limpar_expirados(self):
+        # Chamado com o lock adquirido; chaves expiradas que nunca mais são lidas também saem da memória
+        agora = time.monotonic()
+        if agora < self._proxima_limpeza:
+            return
+        self._proxima_limpeza = agora + INTERVALO_LIMPEZA_S
+        for chave in [chave for chave, expira in self._expiracoes.items() if expira <= agora]:
+            self._expirado(chave)
+
+    def obter(self, chave):
+        with self._lock:
+            if self._expirado(chave):
+                return None
+            return self._valores.get(chave)
+
+    def definir(self, chave, valor, ttl=None):
+        with self._lock:
+            self._limpar_expirados()
+            self._valores[chave] = valor
+            if ttl:
+                self._expiracoes[chave] = time.monotonic() + ttl
+            else:
+                self._expiracoes.pop(chave, None)
+
+    def remover(self, chave):
+        with self._lock:
+            self._expiracoes.pop(chave, None)
+            removidos = (self._valores.pop(chave, None) is not None) + (self._filas.pop(chave, None) is not None)
+            return 1 if removidos else 0
+
+    def incrementar(self, chave):
+        with self._lock:
+            self._expirado(chave)
+            valor = int(self._valores.get(chave, 0)) + 1
+            self._valores[chave] = str(valor)
+            return valor
+
+    def expirar(self, chave, ttl):
+        with self._lock:
+            if self._expirado(chave) or (chave not in self._valores and chave not in self._filas):
+                return 0
+            self._expiracoes[chave] = time.monotonic() + ttl
+            return 1
+
+    def enfileirar(self, fila, valor):
+        with self._condicao:
+            self._limpar_expirados()
+            self._expirado(fila)
+            self._filas.setdefault(fila, deque()).append(valor)
+            self._condicao.notify_all()
+            return len(self._filas[fila])
+
+    def desenfileirar(self, fila, timeout=0):
+        limite = time.monotonic() + timeout
+        with self._condicao:
+            while self._expirado(fila) or not self._filas.get(fila):
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return None
+                self._condicao.wait(restante)
+            valor = self._filas[fila].popleft()
+            # Como no Redis, a fila vazia deixa de existir (e com ela a expiração)
+            if not self._filas[fila]:
+                del self._filas[fila]
+                self._expiracoes.pop(fila, None)
+            return valor
+
+    def tamanho_fila(self, fila):
+        with self._lock:
+            if self._expirado(fila):
+                return 0
+            return len(self._filas.get(fila, ()))
+
+
+class EstadoRedis(BackendEstado):
+    """Backend que fala o protocolo Redis (RESP2) diretamente por socket.
+
+    Mantém uma conexão por thread, sem depender de bibliotecas externas.
+    """
+
+    def __init__(self, host="localhost", porta=6379, db=0, timeout=5.0):
+        self.host = host
+        self.porta = porta
+        self.db = db
+        self.timeout = timeout
+        self._local = threading.local()
+        self._indisponivel_ate = 0.0
+
+    @classmethod
+    def da_url(cls, url):
+        partes = urlparse(url)
+        db = int(partes.path.strip("/") or 0)
+        return cls(partes.hostname or "localhost", partes.port or 6379, db)
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            if time.monotonic() < self._indisponivel_ate:
+                raise ConnectionError(f"Backend de estado {self.host}:{self.porta} indisponível")
+            try:
+                sock = socket.create_connection((self.host, self.porta), timeout=self.timeout)
+            except OSError:
+                self._indisponivel_ate = time.monotonic() + PAUSA_APOS_FALHA_CONEXAO_S
+                raise
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conexao = (sock, sock.makefile("rb"))
+            self._local.conexao = conexao
+            if self.db:
+                self._executar("SELECT", self.db)
+        return conexao
+
+    def _descartar_conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        self._local.conexao = None
+        if conexao is not None:
+            conexao[1].close()
+            conexao[0].close()
+
+    def _executar(self, *argumentos, timeout=None):
+        sock, leitor = self._conexao()
+        partes = [f"*{len(argumentos)}\r\n".encode()]
+        for argumento in argumentos:
+            dado = argumento if isinstance(argumento, bytes) else str(argumento).encode("utf-8")
+            partes.append(f"${len(dado)}\r\n".encode() + dado + b"\r\n")
+        try:
+            sock.settimeout(timeout if timeout is not None else self.timeout)
+            sock.sendall(b"".join(partes))
+            return self._ler_resposta(leitor)
+        except (OSError, ConnectionError):
+            self._descartar_conexao()
+            raise
+
+    def _ler_resposta(self, leitor):
+        linha = leitor.readline()
+        if not linha:
+            raise ConnectionError("Conexão encerrada pelo servidor")
+        tipo, conteudo = linha[:1], linha[1:-2]
+        if tipo == b"+":
+            return conteudo.decode("utf-8")
+        if tipo == b"-":
+            raise ErroRedis(conteudo.decode("utf-8"))
+        if tipo == b":":
+            return int(conteudo)
+        if tipo == b"$":
+            tamanho = int(conteudo)
+            if tamanho < 0:
+                return None
+            dado = leitor.read(tamanho + 2)
+            return dado[:-2].decode("utf-8")
+        if tipo == b"*":
+            quantidade = int(conteudo)
+            if quantidade < 0:
+                return None
+            return [self._ler_resposta(leitor) for _ in range(quantidade)]
+        raise ErroRedis(f"Resposta RESP inesperada: {linha!r}")
+
+    def obter(self, chave):
+        return self._executar("GET", chave)
+
+    def definir(self, chave, valor, ttl=None):
+        if ttl:
+            self._executar("SET", chave, valor, "EX", int(ttl))
+        else:
+            self._executar("SET", chave, valor)
+
+    def remover(self, chave):
+        return self._executar("DEL", chave)
+
+    def incrementar(self, chave):
+        return self._executar("INCR", chave)
+
+    def expirar(self, chave, ttl):
+        return self._executar("EXPIRE", chave, int(ttl))
+
+    def enfileirar(self, fila, valor):
+        return self._executar("RPUSH", fila, valor)
+
+    def tamanho_fila(self, fila):
+        return self._executar("LLEN", fila)
+
+    def desenfileirar(self, fila, timeout=0):
+        if not timeout:
+            return self._executar("LPOP", fila)
+        # BRPOP/BLPOP aceitam timeout fracionário desde o Redis 6; arredonda para cima por segurança
+        resposta = self._executar("BLPOP", fila, max(1, int(timeout + 0.999)), timeout=timeout + self.timeout)
+        return resposta[1] if resposta else None
+
+
+def criar_backend(url=URL_ESTADO_PADRAO):
+    """Cria o backend de estado a partir da URL (memoria:// ou redis://host:porta/db)."""
+    esquema = urlparse(url).scheme
+    if esquema in ("", "memoria"):
+        return EstadoMemoria()
+    if esquema == "redis":
+        return EstadoRedis.da_url(url)
+    raise ValueError(f"Backend de estado desconhecido: {url}")
+
+
+class CacheRefinamento:
+    """Cache de textos refinados pela IA, compartilhado entre réplicas pelo backend.
+
+    A chave cobre todos os parâmetros da chamada (modelo, mensagens, max_tokens, temperatura),
+    então mudar o prompt ou a configuração não reaproveita respostas antigas. Falhas do backend
+    contam como falta no cache: o refinamento segue direto pela OpenAI.
+    """
+
+    def __init__(self, backend, prefixo="refinamento", ttl=TTL_CACHE_REFINAMENTO):
+        self.backend = backend
+        self.prefixo = prefixo
+        self.ttl = ttl
+
+    def chave(self, parametros: dict):
+        serializado = json.dumps(parametros, ensure_ascii=False, sort_keys=True)
+        return f"{self.prefixo}:{hashlib.sha256(serializado.encode('utf-8')).hexdigest()}"
+
+    def obter(self, parametros: dict):
+        try:
+            valor = self.backend.obter(self.chave(parametros))
+            self.backend.incrementar(f"{self.prefixo}:estatisticas:{'acertos' if valor is not None else 'falhas'}")
+        except ERROS_BACKEND as e:
+            logger.warning("Cache de refinamento indisponível: %s", e)
+            return None
+        return valor
+
+    def guardar(self, parametros: dict, refinado):
+        try:
+            self.backend.definir(self.chave(parametros), refinado, ttl=self.ttl)
+        except ERROS_BACKEND as e:
+            logger.warning("Cache de refinamento indisponível: %s", e)
+
+    def estatisticas(self):
+        acertos = int(self.backend.obter(f"{self.prefixo}:estatisticas:acertos") or 0)
+        falhas = int(self.backend.obter(f"{self.prefixo}:estatisticas:falhas") or 0)
+        total = acertos + falhas
+        return {"acertos": acertos, "falhas": falhas, "taxa_acerto": acertos / total if total else 0.0}
+
+
+class FilaTrabalhos:
+    """Fila de trabalhos JSON compartilhada; qualquer réplica pode consumir.
+
+    Com `ttl`, a fila inteira expira se ficar esse tempo sem novos itens (útil para filas de
+    resposta de uma réplica que pode deixar de existir).
+    """
+
+    def __init__(self, backend, nome="trabalhos", ttl=None):
+        self.backend = backend
+        self.nome = f"fila:{nome}"
+        self.ttl = ttl
+
+    def enfileirar(self, trabalho: dict):
+        tamanho = self.backend.enfileirar(self.nome, json.dumps(trabalho, ensure_ascii=False))
+        if self.ttl:
+            self.backend.expirar(self.nome, self.ttl)
+        return tamanho
+
+    def desenfileirar(self, timeout=0):
+        valor = self.backend.desenfileirar(self.nome, timeout)
+        return json.loads(valor) if valor is not None else None
+
+    def tamanho(self):
+        return self.backend.tamanho_fila(self.nome)
+
+
+class Rascunhos:
+    """Rascunhos de formulário com expiração, recuperáveis a partir de qualquer réplica.
+
+    Os campos de CAMPOS_FORA_DO_RASCUNHO são descartados ao salvar. Falhas do backend são
+    registradas e tratadas como rascunho ausente, sem interromper o formulário.
+    """
+
+    def __init__(self, backend, ttl=TTL_RASCUNHO):
+        self.backend = backend
+        self.ttl = ttl
+
+    def salvar(self, identificador, rascunho: dict):
+        rascunho = {chave: valor for chave, valor in rascunho.items() if chave not in CAMPOS_FORA_DO_RASCUNHO}
+        try:
+            self.backend.definir(f"rascunho:{identificador}", json.dumps(rascunho, ensure_ascii=False), ttl=self.ttl)
+            return True
+        except ERROS_BACKEND as e:
+            logger.warning("Rascunho não salvo, backend de estado indisponível: %s", e)
+            return False
+
+    def carregar(self, identificador):
+        try:
+            valor = self.backend.obter(f"rascunho:{identificador}")
+        except ERROS_BACKEND as e:
+            logger.warning("Rascunho não carregado, backend de estado indisponível: %s", e)
+            return None
+        return json.loads(valor) if valor is not None else None
+
+    def remover(self, identificador):
+        try:
+            self.backend.remover(f"rascunho:{identificador}")
+        except ERROS_BACKEND as e:
+            logger.warning("Rascunho não removido, backend de estado indisponível: %s", e)
+
+
+class _HandlerResp(socketserver.StreamRequestHandler):
+    # Respostas saem em várias escritas pequenas; com Nagle, cada BLPOP atendido esperaria o ACK atrasado
+    disable_nagle_algorithm = True
+
+    def _ler_comando(self):
+        linha = self.rfile.readline()
+        if not linha:
+            return None
+        if not linha.startswith(b"*"):
+            return linha.decode("utf-8").split()
+        argumentos = []
+        for _ in range(int(linha[1:-2])):
+            tamanho = int(self.rfile.readline()[1:-2])
+            argumentos.append(self.rfile.read(tamanho + 2)[:-2].decode("utf-8"))
+        return argumentos
+
+    def _escrever(self, valor):
+        if valor is None:
+            self.wfile.write(b"$-1\r\n")
+        elif isinstance(valor, bool):
+            self.wfile.write(b"+OK\r\n")
+        elif isinstance(valor, int):
+            self.wfile.write(f":{valor}\r\n".encode())
+        elif isinstance(valor, list):
+            self.wfile.write(f"*{len(valor)}\r\n".encode())
+            for item in valor:
+                self._escrever(item)
+        else:
+            dado = str(valor).encode("utf-8")
+            self.wfile.write(f"${len(dado)}\r\n".encode() + dado + b"\r\n")
+
+    def handle(self):
+        estado = self.server.estado
+        while True:
+            comando = self._ler_comando()
+            if comando is None:
+                return
+            nome, argumentos = comando[0].upper(), comando[1:]
+            try:
+                if nome == "PING":
+                    self.wfile.write(b"+PONG\r\n")
+                elif nome == "SELECT":
+                    self._escrever(True)
+                elif nome == "GET":
+                    self._escrever(estado.obter(argumentos[0]))
+                elif nome == "SET":
+                    ttl = int(argumentos[3]) if len(argumentos) >= 4 and argumentos[2].upper() == "EX" else None
+                    estado.definir(argumentos[0], argumentos[1], ttl)
+                    self._escrever(True)
+                elif nome == "DEL":
+                    self._escrever(sum(estado.remover(chave) for chave in argumentos))
+                elif nome == "INCR":
+                    self._escrever(estado.incrementar(argumentos[0]))
+                elif nome == "EXPIRE":
+                    self._escrever(estado.expirar(argumentos[0], int(argumentos[1])))
+                elif nome == "LLEN":
+                    self._escrever(estado.tamanho_fila(argumentos[0]))
+                elif nome == "RPUSH":
+                    tamanho = 0
+                    for valor in argumentos[1:]:
+                        tamanho = estado.enfileirar(argumentos[0], valor)
+                    self._escrever(tamanho)
+                elif nome == "LPOP":
+                    self._escrever(estado.desenfileirar(argumentos[0]))
+                elif nome == "BLPOP":
+                    valor = estado.desenfileirar(argumentos[0], float(argumentos[-1]) or 3600)
+                    self._escrever([argumentos[0], valor] if valor is not None else None)
+                else:
+                    self.wfile.write(f"-ERR comando não suportado '{nome}'\r\n".encode("utf-8"))
+            except (IndexError, ValueError):
+                self.wfile.write(f"-ERR argumentos inválidos para '{nome}'\r\n".encode("utf-8"))
+            self.wfile.flush()
+
+
+class ServidorRespLocal(socketserver.ThreadingTCPServer):
+    """Substituto local do Redis para testes e benchmarks.
+
+    Implementa apenas os comandos usados por EstadoRedis, sobre um EstadoMemoria.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, endereco=("127.0.0.1", 0)):
+        super().__init__(endereco, _HandlerResp)
+        self.estado = EstadoMemoria()
+
+    @property
+    def url(self):
+        host, porta = self.server_address[:2]
+        return f"redis://{host}:{porta}/0"
+
+    def iniciar_em_thread(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
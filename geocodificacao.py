@@ -0,0 +1,257 @@
+import csv
+import json
+import os
+import sys
+import unicodedata
+
+import numpy as np
+
+from georreferenciamento import parsear_pontos
+
+# Malha municipal do IBGE em GeoJSON (ex.: BR_Municipios_2022 convertida, ou só RO)
+CAMINHO_MALHA_PADRAO = os.environ.get("MALHA_MUNICIPIOS_PATH", os.path.join("dados", "municipios.geojson"))
+
+# Tamanho da célula da grade de busca, em graus (~11 km no Equador)
+TAMANHO_CELULA_GRAUS = 0.1
+
+# Limite de elementos (arestas x pontos) das matrizes temporárias do ponto-em-polígono;
+# 4M elementos ocupam ~32 MB por matriz de float64
+ELEMENTOS_POR_BLOCO = 1 << 22
+
+# Nomes de propriedades usados nas diferentes versões da malha do IBGE
+_CHAVES_NOME = ("NM_MUN", "NM_MUNICIP", "nome", "name")
+_CHAVES_UF = ("SIGLA_UF", "SIGLA", "uf")
+_CHAVES_CODIGO = ("CD_MUN", "CD_GEOCMU", "codarea", "id")
+
+
+def normalizar_nome(nome: str) -> str:
+    """Remove acentos, espaços extras e caixa para comparar nomes de municípios."""
+    sem_acento = unicodedata.normalize("NFKD", nome or "").encode("ascii", "ignore").decode("ascii")
+    return " ".join(sem_acento.replace("'", " ").split()).casefold()
+
+
+def normalizar_uf(uf: str) -> str:
+    """Sigla da UF sem espaços e em maiúsculas ("ro " -> "RO")."""
+    return (uf or "").strip().upper()
+
+
+def _primeira_propriedade(propriedades: dict, chaves) -> str:
+    for chave in chaves:
+        if propriedades.get(chave) not in (None, ""):
+            return str(propriedades[chave])
+    return ""
+
+
+class IndiceMunicipios:
+    """Índice espacial em grade de bounding boxes com refinamento por ponto-em-polígono."""
+
+    def __init__(self, municipios, aneis, caixas, tamanho_celula=TAMANHO_CELULA_GRAUS):
+        self.municipios = municipios          # lista de dicts: nome, uf, codigo
+        self.aneis = aneis                    # por município: lista de arrays (N, 2) em (lon, lat)
+        self.caixas = caixas                  # array (M, 4): lon_min, lat_min, lon_max, lat_max
+        self.tamanho_celula = tamanho_celula
+        self.origem = (caixas[:, 0].min(), caixas[:, 1].min()) if len(caixas) else (0.0, 0.0)
+        self.grade = {}
+
+        # Arestas pré-calculadas por anel (x1, y1, x2, y2) para o ponto-em-polígono
+        self.arestas = [
+            [(anel[:, 0], anel[:, 1], np.roll(anel[:, 0], -1), np.roll(anel[:, 1], -1)) for anel in aneis_municipio]
+            for aneis_municipio in aneis
+        ]
+
+        for indice, (lon_min, lat_min, lon_max, lat_max) in enumerate(caixas):
+            c0, l0 = self._celula(lon_min, lat_min)
+            c1, l1 = self._celula(lon_max, lat_max)
+            for coluna in range(c0, c1 + 1):
+                for linha in range(l0, l1 + 1):
+                    self.grade.setdefault((coluna, linha), []).append(indice)
+
+    @classmethod
+    def carregar(cls, caminho=CAMINHO_MALHA_PADRAO, tamanho_celula=TAMANHO_CELULA_GRAUS):
+        """Lê a malha GeoJSON do IBGE e constrói o índice."""
+        with open(caminho, encoding="utf-8") as arquivo:
+            geojson = json.load(arquivo)
+
+        municipios, aneis, caixas = [], [], []
+        for feature in geojson.get("features", []):
+            geometria = feature.get("geometry") or {}
+            if geometria.get("type") == "Polygon":
+                poligonos = [geometria["coordinates"]]
+            elif geometria.get("type") == "MultiPolygon":
+                poligonos = geometria["coordinates"]
+            else:
+                continue
+
+            aneis_municipio = [np.asarray(anel, dtype=np.float64)[:, :2] for poligono in poligonos for anel in poligono]
+            todos = np.concatenate(aneis_municipio)
+            propriedades = feature.get("properties") or {}
+
+            municipios.append({
+                "nome": _primeira_propriedade(propriedades, _CHAVES_NOME),
+                "uf": normalizar_uf(_primeira_propriedade(propriedades, _CHAVES_UF)),
+                "codigo": _primeira_propriedade(propriedades, _CHAVES_CODIGO),
+            })
+            aneis.append(aneis_municipio)
+            caixas.append((todos[:, 0].min(), todos[:, 1].min(), todos[:, 0].max(), todos[:, 1].max()))
+
+        return cls(municipios, aneis, np.array(caixas, dtype=np.float64).reshape(-1, 4), tamanho_celula)
+
+    def _celula(self, lon, lat):
+        return (int((lon - self.origem[0]) // self.tamanho_celula),
+                int((lat - self.origem[1]) // self.tamanho_celula))
+
+    def _contem(self, indice, lon, lat) -> np.ndarray:
+        """Ray casting par-ímpar vetorizado (arestas x pontos); buracos são tratados naturalmente.
+
+        Os pontos são processados em blocos para limitar a matriz arestas x pontos a
+        ELEMENTOS_POR_BLOCO, mesmo em municípios com dezenas de milhares de vértices.
+        """
+        lon = np.atleast_1d(lon)
+        lat = np.atleast_1d(lat)
+        dentro = np.zeros(len(lon), dtype=bool)
+        for x1, y1, x2, y2 in self.arestas[indice]:
+            passo = max(1, ELEMENTOS_POR_BLOCO // len(x1))
+            x1, y1, x2, y2 = x1[:, None], y1[:, None], x2[:, None], y2[:, None]
+            for inicio in range(0, len(lon), passo):
+                lon_bloco = lon[inicio:inicio + passo]
+                lat_bloco = lat[inicio:inicio + passo]
+                cruza = (y1 > lat_bloco) != (y2 > lat_bloco)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    x_interseccao = x1 + (lat_bloco - y1) * (x2 - x1) / (y2 - y1)
+                dentro[inicio:inicio + passo] ^= (np.count_nonzero(cruza & (lon_bloco < x_interseccao), axis=0) % 2).astype(bool)
+        return dentro
+
+    def localizar(self, lat: float, lon: float):
+        """Retorna o município (dict com nome, uf, codigo) que contém o ponto, ou None."""
+        for indice in self.grade.get(self._celula(lon, lat), ()):
+            lon_min, lat_min, lon_max, lat_max = self.caixas[indice]
+            if lon_min <= lon <= lon_max and lat_min <= lat <= lat_max and self._contem(indice, lon, lat)[0]:
+                return self.municipios[indice]
+        return None
+
+    def localizar_lote(self, lats, lons) -> np.ndarray:
+        """Localiza vários pontos de uma vez; retorna o índice do município de cada ponto (-1 se nenhum).
+
+        Os pontos são agrupados pelas células da grade, então cada município só testa os pontos
+        das células que sua bounding box ocupa.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        resultado = np.full(len(lats), -1, dtype=np.int64)
+
+        validos = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+        colunas = ((lons[validos] - self.origem[0]) // self.tamanho_celula).astype(np.int64)
+        linhas = ((lats[validos] - self.origem[1]) // self.tamanho_celula).astype(np.int64)
+        celulas, grupo = np.unique(np.stack((colunas, linhas), axis=1), axis=0, return_inverse=True)
+        ordem = np.argsort(grupo.ravel(), kind="stable")
+        limites = np.searchsorted(grupo.ravel()[ordem], np.arange(len(celulas) + 1))
+
+        pontos_por_municipio = {}
+        for k, (coluna, linha) in enumerate(celulas.tolist()):
+            pontos_celula = validos[ordem[limites[k]:limites[k + 1]]]
+            for indice in self.grade.get((coluna, linha), ()):
+                pontos_por_municipio.setdefault(indice, []).append(pontos_celula)
+
+        # Em ordem de índice, como em localizar(): o primeiro município que contém o ponto vence
+        for indice in sorted(pontos_por_municipio):
+            lon_min, lat_min, lon_max, lat_max = self.caixas[indice]
+            candidatos = np.concatenate(pontos_por_municipio[indice])
+            candidatos = candidatos[(resultado[candidatos] < 0) & (lons[candidatos] >= lon_min)
+                                    & (lons[candidatos] <= lon_max) & (lats[candidatos] >= lat_min)
+                                    & (lats[candidatos] <= lat_max)]
+            if len(candidatos):
+                dentro = self._contem(indice, lons[candidatos], lats[candidatos])
+                resultado[candidatos[dentro]] = indice
+
+        return resultado
+
+
+def conferir_municipio(indice: IndiceMunicipios, lat_long: str, municipio: str, uf: str):
+    """Confere município/UF digitados contra a coordenada.
+
+    Retorna (municipio_encontrado, divergencias), onde divergencias lista os campos que não
+    batem. municipio_encontrado é None se a coordenada não cair em nenhum município da malha.
+    """
+    pontos = parsear_pontos(lat_long)
+    if len(pontos) == 0:
+        raise ValueError("Coordenada inválida.")
+
+    encontrado = indice.localizar(pontos[0, 0], pontos[0, 1])
+    if encontrado is None:
+        return None, []
+
+    divergencias = []
+    if municipio.strip() and normalizar_nome(municipio) != normalizar_nome(encontrado["nome"]):
+        divergencias.append("Município")
+    if normalizar_uf(uf) and encontrado["uf"] and normalizar_uf(uf) != encontrado["uf"]:
+        divergencias.append("UF")
+    return encontrado, divergencias
+
+
+def validar_lote(indice: IndiceMunicipios, registros):
+    """Confere em lote registros com as chaves lat_long_sede, municipio e uf.
+
+    Retorna uma lista de dicts com o registro, o município encontrado e as divergências.
+    """
+    registros = list(registros)
+    coordenadas = np.full((len(registros), 2), np.nan)
+    for i, registro in enumerate(registros):
+        try:
+            pontos = parsear_pontos(registro.get("lat_long_sede", ""))
+        except ValueError:
+            continue
+        if len(pontos):
+            coordenadas[i] = pontos[0]
+
+    indices = np.full(len(registros), -1, dtype=np.int64)
+    validas = ~np.isnan(coordenadas[:, 0])
+    indices[validas] = indice.localizar_lote(coordenadas[validas, 0], coordenadas[validas, 1])
+
+    resultado = []
+    for registro, indice_municipio, valida in zip(registros, indices, validas):
+        encontrado = indice.municipios[indice_municipio] if indice_municipio >= 0 else None
+        divergencias = []
+        if not valida:
+            divergencias.append("Coordenada inválida")
+        elif encontrado is None:
+            divergencias.append("Fora da malha")
+        else:
+            if normalizar_nome(registro.get("municipio", "")) != normalizar_nome(encontrado["nome"]):
+                divergencias.append("Município")
+            uf = normalizar_uf(registro.get("uf"))
+            if uf and encontrado["uf"] and uf != encontrado["uf"]:
+                divergencias.append("UF")
+        resultado.append({"registro": registro, "municipio_encontrado": encontrado, "divergencias": divergencias})
+    return resultado
+
+
+def main(argv=None):
+    """Uso: python geocodificacao.py visitas.csv [malha.geojson]
+
+    O CSV deve ter as colunas lat_long_sede, municipio e uf. Imprime as linhas divergentes.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(main.__doc__)
+        return 2
+
+    indice = IndiceMunicipios.carregar(argv[1] if len(argv) > 1 else CAMINHO_MALHA_PADRAO)
+    with open(argv[0], encoding="utf-8", newline="") as arquivo:
+        registros = list(csv.DictReader(arquivo))
+
+    resultado = validar_lote(indice, registros)
+    divergentes = 0
+    for linha, item in enumerate(resultado, start=2):
+        if item["divergencias"]:
+            divergentes += 1
+            encontrado = item["municipio_encontrado"]
+            sugestao = f"{encontrado['nome']}/{encontrado['uf']}" if encontrado else "-"
+            print(f"Linha {linha}: {', '.join(item['divergencias'])} | informado: "
+                  f"{item['registro'].get('municipio', '')}/{item['registro'].get('uf', '')} | pela coordenada: {sugestao}")
+
+    print(f"{len(resultado)} registros conferidos, {divergentes} com divergência.")
+    return 1 if divergentes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
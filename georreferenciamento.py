@@ -0,0 +1,215 @@
+import re
+
+import numpy as np
+
+# Raio autálico do elipsoide GRS80/SIRGAS 2000 (esfera de mesma área), em metros
+RAIO_AUTALICO_M = 6371007.181
+# Raio médio do elipsoide GRS80/SIRGAS 2000, em metros
+RAIO_MEDIO_M = 6371008.771
+
+# Alqueire paulista, unidade usual no Vale do Jamari
+HECTARES_POR_ALQUEIRE = 2.42
+
+# Diferença relativa entre área declarada e área medida a partir da qual se emite alerta
+TOLERANCIA_DISCREPANCIA_AREA = 0.20
+
+# Abaixo destes valores o perímetro é considerado degenerado (pontos colineares, ida e volta
+# pela mesma cerca). Compacidade = 4*pi*área/perímetro², 1 para o círculo; 1e-3 equivale a
+# uma faixa de ~4 km por 1 m.
+AREA_MINIMA_M2 = 1.0
+COMPACIDADE_MINIMA = 1e-3
+
+# Pares de segmentos testados por vez na verificação de autointerseção
+PARES_POR_BLOCO = 1 << 20
+
+# Cruzamentos que formam laços mais finos que isto (espessura média = 2*área/perímetro do laço
+# menor) são ruído do GPS ao percorrer a cerca e são ignorados; o erro de área que causam é
+# desprezível. O componente de captura aceita fixações com até 20 m de erro.
+ESPESSURA_MAXIMA_LACO_M = 10.0
+
+_PADRAO_COORDENADA = re.compile(r'(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)')
+
+
+def parsear_pontos(texto: str) -> np.ndarray:
+    """Converte o texto de pontos "lat, long" (um por linha ou separados por ';') em array (N, 2)."""
+    if not isinstance(texto, str):
+        raise ValueError("Pontos do perímetro devem ser informados como texto.")
+
+    pares = _PADRAO_COORDENADA.findall(texto)
+    pontos = np.array(pares, dtype=np.float64).reshape(-1, 2)
+
+    if len(pontos) and (np.any(np.abs(pontos[:, 0]) > 90) or np.any(np.abs(pontos[:, 1]) > 180)):
+        raise ValueError("Há coordenadas fora dos limites válidos de latitude/longitude.")
+
+    # Remove fixações repetidas em sequência (GPS parado no mesmo ponto)
+    if len(pontos) > 1:
+        repetido = np.all(pontos[1:] == pontos[:-1], axis=1)
+        pontos = pontos[np.concatenate(([True], ~repetido))]
+
+    # Remove o ponto de fechamento se o percurso terminou sobre o ponto inicial
+    if len(pontos) > 1 and np.array_equal(pontos[0], pontos[-1]):
+        pontos = pontos[:-1]
+
+    return pontos
+
+
+def _orientacao(ax, ay, bx, by, cx, cy):
+    return np.sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+
+
+def _laco_relevante(x, y, i, j):
+    """Para os pares de segmentos (i, j) que se cruzam, indica se o laço menor formado é relevante.
+
+    O contorno se divide no ponto de cruzamento em dois laços; o menor é comparado com
+    ESPESSURA_MAXIMA_LACO_M. x e y em metros.
+    """
+    n = len(x)
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    x_prox, y_prox = np.roll(x, -1), np.roll(y, -1)
+    cruzado = x * y_prox - x_prox * y
+    comprimento = np.hypot(x_prox - x, y_prox - y)
+    soma_cruzado = np.concatenate(([0.0], np.cumsum(cruzado)))
+    soma_comprimento = np.concatenate(([0.0], np.cumsum(comprimento)))
+
+    # Ponto de cruzamento; em segmentos paralelos sobrepostos, o início do segmento seguinte
+    rx, ry = x_prox[i] - x[i], y_prox[i] - y[i]
+    sx, sy = x_prox[j] - x[j], y_prox[j] - y[j]
+    denominador = rx * sy - ry * sx
+    paralelos = denominador == 0
+    t = np.where(paralelos, 1.0, ((x[j] - x[i]) * sy - (y[j] - y[i]) * sx) / np.where(paralelos, 1.0, denominador))
+    px, py = x[i] + t * rx, y[i] + t * ry
+
+    # Laço interno: cruzamento, v[i+1], ..., v[j]
+    a, b = (i + 1) % n, j
+    area_interna = (soma_cruzado[j] - soma_cruzado[i + 1] + (x[b] * py - px * y[b]) + (px * y[a] - x[a] * py)) / 2
+    perimetro_interno = (soma_comprimento[j] - soma_comprimento[i + 1]
+                         + np.hypot(x[b] - px, y[b] - py) + np.hypot(px - x[a], py - y[a]))
+    # Laço externo: cruzamento, v[j+1], ..., v[i] (dando a volta)
+    c, d = (j + 1) % n, i
+    area_externa = (soma_cruzado[n] - (soma_cruzado[j + 1] - soma_cruzado[i])
+                    + (px * y[c] - x[c] * py) + (x[d] * py - px * y[d])) / 2
+    perimetro_externo = (soma_comprimento[n] - (soma_comprimento[j + 1] - soma_comprimento[i])
+                         + np.hypot(x[c] - px, y[c] - py) + np.hypot(px - x[d], py - y[d]))
+
+    interno_menor = np.abs(area_interna) <= np.abs(area_externa)
+    area = np.where(interno_menor, np.abs(area_interna), np.abs(area_externa))
+    perimetro = np.where(interno_menor, perimetro_interno, perimetro_externo)
+    return 2 * area > ESPESSURA_MAXIMA_LACO_M * perimetro
+
+
+def _cruza_a_si_mesmo(x: np.ndarray, y: np.ndarray) -> bool:
+    """Indica se o contorno fechado (x, y), em metros, cruza a si mesmo formando um laço relevante.
+
+    Usa varredura pelo eixo x: só são testados os pares de segmentos cujas faixas de x se
+    sobrepõem, o que para um contorno percorrido a pé fica próximo de O(N).
+    """
+    n = len(x)
+    if n < 4:
+        return False
+    x_prox, y_prox = np.roll(x, -1), np.roll(y, -1)
+
+    x_min, x_max = np.minimum(x, x_prox), np.maximum(x, x_prox)
+    y_min, y_max = np.minimum(y, y_prox), np.maximum(y, y_prox)
+    ordem = np.argsort(x_min, kind="stable")
+    fim = np.searchsorted(x_min[ordem], x_max[ordem], side="right")
+    quantidade = np.maximum(fim - np.arange(1, n + 1), 0)
+
+    inicio_bloco = 0
+    acumulado = np.cumsum(quantidade)
+    while inicio_bloco < n:
+        base = acumulado[inicio_bloco - 1] if inicio_bloco else 0
+        fim_bloco = max(int(np.searchsorted(acumulado, base + PARES_POR_BLOCO, side="right")), inicio_bloco + 1)
+        qtd = quantidade[inicio_bloco:fim_bloco]
+        if qtd.sum():
+            pos_i = np.repeat(np.arange(inicio_bloco, fim_bloco), qtd)
+            deslocamento = np.arange(len(pos_i)) - np.repeat(np.cumsum(qtd) - qtd, qtd)
+            i = ordem[pos_i]
+            j = ordem[pos_i + 1 + deslocamento]
+
+            # Segmentos vizinhos compartilham um vértice por construção
+            vizinhos = (np.abs(i - j) == 1) | (np.abs(i - j) == n - 1)
+            candidatos = ~vizinhos & (y_min[i] <= y_max[j]) & (y_min[j] <= y_max[i])
+            i, j = i[candidatos], j[candidatos]
+
+            d1 = _orientacao(x[j], y[j], x_prox[j], y_prox[j], x[i], y[i])
+            d2 = _orientacao(x[j], y[j], x_prox[j], y_prox[j], x_prox[i], y_prox[i])
+            d3 = _orientacao(x[i], y[i], x_prox[i], y_prox[i], x[j], y[j])
+            d4 = _orientacao(x[i], y[i], x_prox[i], y_prox[i], x_prox[j], y_prox[j])
+            cruzam = (d1 * d2 <= 0) & (d3 * d4 <= 0)
+            if np.any(cruzam) and np.any(_laco_relevante(x, y, i[cruzam], j[cruzam])):
+                return True
+        inicio_bloco = fim_bloco
+    return False
+
+
+def calcular_area_perimetro(pontos: np.ndarray) -> dict:
+    """Calcula área (ha), perímetro (m) e centroide de um polígono de coordenadas geográficas.
+
+    A área usa o excesso esférico sobre a esfera autálica do SIRGAS 2000 e o perímetro a
+    fórmula de haversine, ambos vetorizados sobre todos os vértices. Levanta ValueError para
+    contornos com área nula ou que cruzam a si mesmos além do ruído do GPS.
+    """
+    pontos = np.asarray(pontos, dtype=np.float64)
+    if pontos.ndim != 2 or pontos.shape[1] != 2 or len(pontos) < 3:
+        raise ValueError("São necessários ao menos 3 pontos para delimitar a propriedade.")
+
+    lat = np.radians(pontos[:, 0])
+    lon = np.radians(pontos[:, 1])
+    lat_prox = np.roll(lat, -1)
+    lon_prox = np.roll(lon, -1)
+
+    # Diferença de longitude normalizada para (-pi, pi], evitando saltos no antimeridiano
+    dlon = (lon_prox - lon + np.pi) % (2 * np.pi) - np.pi
+    dlat = lat_prox - lat
+
+    excesso = np.sum(dlon * (2 + np.sin(lat) + np.sin(lat_prox)))
+    area_m2 = abs(excesso) * RAIO_AUTALICO_M ** 2 / 2
+
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat_prox) * np.sin(dlon / 2) ** 2
+    perimetro_m = float(np.sum(2 * RAIO_MEDIO_M * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))))
+
+    if area_m2 < AREA_MINIMA_M2 or 4 * np.pi * area_m2 / perimetro_m ** 2 < COMPACIDADE_MINIMA:
+        raise ValueError("Os pontos do perímetro não delimitam uma área (pontos alinhados ou percurso de ida e volta).")
+
+    # Centroide em projeção equiretangular local (adequada à escala de uma propriedade)
+    lat0 = lat.mean()
+    x = np.unwrap(lon) * np.cos(lat0)
+    y = lat
+    if _cruza_a_si_mesmo(x * RAIO_MEDIO_M, y * RAIO_MEDIO_M):
+        raise ValueError("O perímetro cruza a si mesmo; registre os pontos em sequência ao redor da propriedade.")
+    x_prox = np.roll(x, -1)
+    y_prox = np.roll(y, -1)
+    cruzado = x * y_prox - x_prox * y
+    area_plana = cruzado.sum() / 2
+    if abs(area_plana) > 0:
+        cx = np.sum((x + x_prox) * cruzado) / (6 * area_plana)
+        cy = np.sum((y + y_prox) * cruzado) / (6 * area_plana)
+    else:
+        cx, cy = x.mean(), y.mean()
+    centroide_lat = float(np.degrees(cy))
+    centroide_lon = float((np.degrees(cx / np.cos(lat0)) + 180) % 360 - 180)
+
+    return {
+        'area_ha': float(area_m2 / 10_000),
+        'perimetro_m': perimetro_m,
+        'centroide': (centroide_lat, centroide_lon),
+        'num_pontos': int(len(pontos)),
+    }
+
+
+def converter_para_hectares(area: float, unidade_area: str) -> float:
+    """Converte a área declarada no formulário para hectares."""
+    if unidade_area == "alqueires":
+        return area * HECTARES_POR_ALQUEIRE
+    return area
+
+
+def verificar_discrepancia_area(area_declarada_ha: float, area_medida_ha: float,
+                                tolerancia: float = TOLERANCIA_DISCREPANCIA_AREA):
+    """Retorna a diferença relativa entre as áreas se ultrapassar a tolerância, senão None."""
+    if area_medida_ha <= 0:
+        return None
+    diferenca = (area_declarada_ha - area_medida_ha) / area_medida_ha
+    if abs(diferenca) > tolerancia:
+        return diferenca
+    return None
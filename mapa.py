@@ -0,0 +1,376 @@
+import argparse
+import base64
+import io
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pydeck as pdk
+import requests
+from PIL import Image
+
+# Pré-visualização de mapa offline: tiles raster guardados em disco (dados/tiles/{z}/{x}/{y}.png),
+# com despejo LRU por tamanho total, combinados num mosaico exibido pelo pydeck sem mapa base externo.
+
+DIRETORIO_TILES_PADRAO = os.environ.get("TILES_PATH", os.path.join("dados", "tiles"))
+# Servidor de tiles XYZ. Sem TILES_URL, tiles avulsos da pré-visualização vêm do OpenStreetMap, cuja
+# política não permite download em lote: o pré-carregamento exige TILES_URL de outro provedor.
+URL_TILES_CONFIGURADA = os.environ.get("TILES_URL")
+URL_TILES_PADRAO = URL_TILES_CONFIGURADA or "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+TAMANHO_MAXIMO_CACHE_MB = int(os.environ.get("TILES_CACHE_MB", "1024"))
+TAMANHO_TILE = 256
+# Tamanho médio estimado de um tile raster de área rural, para estimar o custo do pré-carregamento
+TAMANHO_MEDIO_TILE_KB = 15
+
+# Zooms da pré-visualização e, por padrão, do pré-carregamento. Até o zoom 15 a região cabe no
+# cache padrão (~41 mil tiles, ~600 MB); o zoom 16 sozinho somaria mais 120 mil tiles.
+ZOOM_MINIMO_PRE_CARGA = 8
+ZOOM_MAXIMO_PREVIA = 15
+# Após uma falha de rede, tiles ausentes não são buscados por este tempo (evita esperar timeouts sem sinal)
+PAUSA_APOS_FALHA_REDE_S = 60
+
+# Região do Programa de Segurança Rural: lat_min, lon_min, lat_max, lon_max
+BBOX_VALE_DO_JAMARI = (-10.60, -64.20, -8.80, -62.20)
+
+CORES_PONTOS = {
+    "Porteira": [255, 152, 0],
+    "Sede": [220, 53, 69],
+    "Visita anterior": [0, 102, 204],
+}
+
+
+def lat_lon_para_tile(lat, lon, zoom):
+    """Converte coordenadas em índices (x, y) de tile no esquema XYZ/Web Mercator."""
+    lat = max(min(lat, 85.0511), -85.0511)
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_para_lat_lon(x, y, zoom):
+    """Canto noroeste do tile (x, y) em coordenadas geográficas."""
+    n = 2 ** zoom
+    lon = x / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    return lat, lon
+
+
+class CacheTiles:
+    """Cache de tiles em disco com despejo do menos recentemente usado (LRU).
+
+    O horário de modificação do arquivo marca o último uso, então a ordem LRU sobrevive a
+    reinícios do app.
+    """
+
+    def __init__(self, diretorio=DIRETORIO_TILES_PADRAO, tamanho_maximo_mb=TAMANHO_MAXIMO_CACHE_MB,
+                 url_tiles=None):
+        self.diretorio = diretorio
+        self.tamanho_maximo = tamanho_maximo_mb * 1024 * 1024
+        # Só um servidor informado explicitamente (argumento ou TILES_URL) pode ser pré-carregado
+        self.url_tiles = url_tiles or URL_TILES_PADRAO
+        self.url_explicita = bool(url_tiles or URL_TILES_CONFIGURADA)
+        self.sessao = requests.Session()
+        self.sessao.headers["User-Agent"] = "gerador-bop-ptr-rural/1.0"
+        self._lock = threading.Lock()
+        self._indice = OrderedDict()   # caminho -> tamanho, do menos para o mais recente
+        self._tamanho_total = 0
+        self._rede_indisponivel_ate = 0.0
+        self._carregar_indice()
+
+    def _carregar_indice(self):
+        arquivos = []
+        for raiz, _, nomes in os.walk(self.diretorio):
+            for nome in nomes:
+                if nome.endswith(".png"):
+                    caminho = os.path.join(raiz, nome)
+                    estatisticas = os.stat(caminho)
+                    arquivos.append((estatisticas.st_mtime, caminho, estatisticas.st_size))
+        for _, caminho, tamanho in sorted(arquivos):
+            self._indice[caminho] = tamanho
+            self._tamanho_total += tamanho
+
+    @property
+    def tamanho_total(self):
+        return self._tamanho_total
+
+    def _caminho(self, z, x, y):
+        return os.path.join(self.diretorio, str(z), str(x), f"{y}.png")
+
+    @property
+    def rede_disponivel(self):
+        """False durante a pausa após uma falha de rede."""
+        return time.monotonic() >= self._rede_indisponivel_ate
+
+    def _presente(self, caminho):
+        """True se o tile está no índice ou em disco; tiles gravados por outro processo (ex.: o
+        pré-carregamento rodando com o app aberto) entram no índice na primeira consulta."""
+        with self._lock:
+            if caminho in self._indice:
+                return True
+        try:
+            tamanho = os.stat(caminho).st_size
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            if caminho not in self._indice:
+                self._indice[caminho] = tamanho
+                self._tamanho_total += tamanho
+        return True
+
+    def em_cache(self, z, x, y):
+        return self._presente(self._caminho(z, x, y))
+
+    def remover(self, z, x, y):
+        """Tira um tile do cache (ex.: arquivo que não é uma imagem válida)."""
+        caminho = self._caminho(z, x, y)
+        with self._lock:
+            self._tamanho_total -= self._indice.pop(caminho, 0)
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+    def _despejar(self):
+        while self._tamanho_total > self.tamanho_maximo and self._indice:
+            caminho, tamanho = self._indice.popitem(last=False)
+            self._tamanho_total -= tamanho
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+    def guardar(self, z, x, y, conteudo: bytes):
+        caminho = self._caminho(z, x, y)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        # Nome temporário único: duas sessões podem baixar o mesmo tile ao mesmo tempo
+        temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+        with open(temporario, "wb") as arquivo:
+            arquivo.write(conteudo)
+        os.replace(temporario, caminho)
+        with self._lock:
+            self._tamanho_total += len(conteudo) - self._indice.pop(caminho, 0)
+            self._indice[caminho] = len(conteudo)
+            self._despejar()
+
+    def obter(self, z, x, y, permitir_rede=True):
+        """Retorna os bytes do tile; busca na rede só em falta no cache e se permitido (None se indisponível)."""
+        caminho = self._caminho(z, x, y)
+        if self._presente(caminho):
+            with self._lock:
+                if caminho in self._indice:
+                    self._indice.move_to_end(caminho)
+            try:
+                with open(caminho, "rb") as arquivo:
+                    conteudo = arquivo.read()
+                os.utime(caminho)
+                return conteudo
+            except FileNotFoundError:
+                with self._lock:
+                    self._tamanho_total -= self._indice.pop(caminho, 0)
+
+        if not permitir_rede or time.monotonic() < self._rede_indisponivel_ate:
+            return None
+        try:
+            resposta = self.sessao.get(self.url_tiles.format(z=z, x=x, y=y), timeout=3)
+            resposta.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout):
+            self._rede_indisponivel_ate = time.monotonic() + PAUSA_APOS_FALHA_REDE_S
+            return None
+        except requests.RequestException:
+            return None
+        # Páginas de erro ou de limite de requisições também chegam com status 2xx
+        if not imagem_valida(resposta.content):
+            return None
+        self.guardar(z, x, y, resposta.content)
+        return resposta.content
+
+    def pre_carregar(self, bbox=BBOX_VALE_DO_JAMARI, zoom_min=ZOOM_MINIMO_PRE_CARGA, zoom_max=ZOOM_MAXIMO_PREVIA,
+                     progresso=None):
+        """Baixa para o cache todos os tiles da região nos níveis de zoom informados.
+
+        Levanta ValueError se o servidor de tiles não foi configurado explicitamente.
+        """
+        if not self.url_explicita:
+            raise ValueError("Configure TILES_URL com um servidor de tiles que permita download em lote "
+                             "(a política do tile.openstreetmap.org não permite).")
+        baixados = 0
+        for zoom in range(zoom_min, zoom_max + 1):
+            x0, y0, x1, y1 = tiles_da_area(*bbox, zoom)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    if self.obter(zoom, x, y) is not None:
+                        baixados += 1
+                    if progresso:
+                        progresso(zoom, x, y, baixados)
+        return baixados
+
+    def maior_zoom_em_cache(self, lat_min, lon_min, lat_max, lon_max, zoom_max):
+        """Maior zoom até zoom_max com todos os tiles da área no cache (None se nenhum)."""
+        for zoom in range(zoom_max, 0, -1):
+            x0, y0, x1, y1 = tiles_da_area(lat_min, lon_min, lat_max, lon_max, zoom)
+            if all(self.em_cache(zoom, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)):
+                return zoom
+        return None
+
+
+def imagem_valida(conteudo: bytes) -> bool:
+    try:
+        with Image.open(io.BytesIO(conteudo)) as imagem:
+            imagem.verify()
+        return True
+    except Exception:
+        return False
+
+
+def tiles_da_area(lat_min, lon_min, lat_max, lon_max, zoom):
+    """Índices (x0, y0, x1, y1) dos tiles que cobrem a área no zoom informado."""
+    x0, y0 = lat_lon_para_tile(lat_max, lon_min, zoom)
+    x1, y1 = lat_lon_para_tile(lat_min, lon_max, zoom)
+    return x0, y0, x1, y1
+
+
+def contar_tiles(bbox, zoom_min, zoom_max):
+    """Quantidade de tiles que cobrem a bbox nos zooms informados."""
+    total = 0
+    for zoom in range(zoom_min, zoom_max + 1):
+        x0, y0, x1, y1 = tiles_da_area(*bbox, zoom)
+        total += (x1 - x0 + 1) * (y1 - y0 + 1)
+    return total
+
+
+def escolher_zoom(lat_min, lon_min, lat_max, lon_max, max_tiles_lado=4, zoom_max=ZOOM_MAXIMO_PREVIA):
+    """Maior zoom em que a área cabe em até max_tiles_lado x max_tiles_lado tiles."""
+    for zoom in range(zoom_max, 0, -1):
+        x0, y0, x1, y1 = tiles_da_area(lat_min, lon_min, lat_max, lon_max, zoom)
+        if x1 - x0 < max_tiles_lado and y1 - y0 < max_tiles_lado:
+            return zoom
+    return 1
+
+
+def _compor(cache, zoom, lat_min, lon_min, lat_max, lon_max, permitir_rede):
+    x0, y0, x1, y1 = tiles_da_area(lat_min, lon_min, lat_max, lon_max, zoom)
+    mosaico = Image.new("RGB", ((x1 - x0 + 1) * TAMANHO_TILE, (y1 - y0 + 1) * TAMANHO_TILE), (229, 227, 223))
+    faltantes = 0
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            conteudo = cache.obter(zoom, x, y, permitir_rede=permitir_rede)
+            if conteudo is None:
+                faltantes += 1
+                continue
+            try:
+                with Image.open(io.BytesIO(conteudo)) as tile:
+                    mosaico.paste(tile.convert("RGB"), ((x - x0) * TAMANHO_TILE, (y - y0) * TAMANHO_TILE))
+            except (OSError, ValueError):
+                # Arquivo corrompido ou que não é imagem: conta como faltante e sai do cache
+                cache.remover(zoom, x, y)
+                faltantes += 1
+    return mosaico, (x0, y0, x1, y1), faltantes
+
+
+def montar_mosaico(cache, lat_min, lon_min, lat_max, lon_max, permitir_rede=True):
+    """Combina os tiles que cobrem a área numa imagem JPEG.
+
+    Retorna (data_uri, bounds, zoom, faltantes), com bounds = [oeste, sul, leste, norte]
+    para o BitmapLayer. Sem rede, o zoom desce até o maior nível que esteja inteiro no cache;
+    tiles ainda indisponíveis ficam em cinza.
+    """
+    zoom = escolher_zoom(lat_min, lon_min, lat_max, lon_max)
+    area = (lat_min, lon_min, lat_max, lon_max)
+    if not (permitir_rede and cache.rede_disponivel):
+        zoom = cache.maior_zoom_em_cache(*area, zoom) or zoom
+    mosaico, tiles, faltantes = _compor(cache, zoom, *area, permitir_rede)
+    # A rede caiu durante a montagem: refaz com o que estiver no cache
+    if faltantes and not cache.rede_disponivel:
+        zoom_em_cache = cache.maior_zoom_em_cache(*area, zoom)
+        if zoom_em_cache is not None and zoom_em_cache != zoom:
+            zoom = zoom_em_cache
+            mosaico, tiles, faltantes = _compor(cache, zoom, *area, permitir_rede=False)
+
+    buffer = io.BytesIO()
+    mosaico.save(buffer, format="JPEG", quality=80)
+    data_uri = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    x0, y0, x1, y1 = tiles
+    norte, oeste = tile_para_lat_lon(x0, y0, zoom)
+    sul, leste = tile_para_lat_lon(x1 + 1, y1 + 1, zoom)
+    return data_uri, [oeste, sul, leste, norte], zoom, faltantes
+
+
+def criar_mapa(pontos, poligono=None, mosaico=None):
+    """Monta o pydeck.Deck com o mosaico de fundo, os pontos e o perímetro (opcional).
+
+    pontos: lista de dicts com lat, lon, tipo (chave de CORES_PONTOS) e rotulo.
+    poligono: lista de (lat, lon) do perímetro. mosaico: retorno de montar_mosaico.
+    """
+    camadas = []
+    if mosaico is not None:
+        data_uri, bounds, _, _ = mosaico
+        camadas.append(pdk.Layer("BitmapLayer", image=data_uri, bounds=bounds))
+    if poligono is not None and len(poligono) >= 3:
+        camadas.append(pdk.Layer(
+            "PolygonLayer",
+            data=[{"contorno": [[lon, lat] for lat, lon in poligono]}],
+            get_polygon="contorno",
+            get_fill_color=[255, 235, 59, 60],
+            get_line_color=[255, 193, 7],
+            line_width_min_pixels=2,
+        ))
+    camadas.append(pdk.Layer(
+        "ScatterplotLayer",
+        data=[dict(p, cor=CORES_PONTOS.get(p["tipo"], [90, 90, 90])) for p in pontos],
+        get_position="[lon, lat]",
+        get_fill_color="cor",
+        get_radius=6,
+        radius_units="pixels",
+        pickable=True,
+    ))
+
+    latitudes = [p["lat"] for p in pontos] or [BBOX_VALE_DO_JAMARI[0]]
+    longitudes = [p["lon"] for p in pontos] or [BBOX_VALE_DO_JAMARI[1]]
+    zoom = mosaico[2] if mosaico is not None else 14
+    vista = pdk.ViewState(latitude=(min(latitudes) + max(latitudes)) / 2,
+                          longitude=(min(longitudes) + max(longitudes)) / 2, zoom=zoom)
+    return pdk.Deck(layers=camadas, initial_view_state=vista, map_style=None, map_provider=None,
+                    tooltip={"text": "{tipo}\n{rotulo}"})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pré-carrega o cache de tiles do Vale do Jamari")
+    parser.add_argument("--zoom-min", type=int, default=ZOOM_MINIMO_PRE_CARGA)
+    parser.add_argument("--zoom-max", type=int, default=ZOOM_MAXIMO_PREVIA)
+    parser.add_argument("--bbox", type=float, nargs=4, default=BBOX_VALE_DO_JAMARI,
+                        metavar=("LAT_MIN", "LON_MIN", "LAT_MAX", "LON_MAX"))
+    parser.add_argument("--tamanho-mb", type=int, default=TAMANHO_MAXIMO_CACHE_MB)
+    parser.add_argument("--url", help="Servidor de tiles XYZ (padrão: TILES_URL)")
+    args = parser.parse_args(argv)
+
+    cache = CacheTiles(tamanho_maximo_mb=args.tamanho_mb, url_tiles=args.url)
+    if not cache.url_explicita:
+        print("Informe --url ou TILES_URL com um servidor de tiles que permita download em lote "
+              "(a política do tile.openstreetmap.org não permite).", file=sys.stderr)
+        return 2
+
+    total_tiles = contar_tiles(tuple(args.bbox), args.zoom_min, args.zoom_max)
+    estimativa_mb = total_tiles * TAMANHO_MEDIO_TILE_KB / 1024
+    print(f"Zooms {args.zoom_min}-{args.zoom_max}: {total_tiles} tiles, ~{estimativa_mb:.0f} MB "
+          f"(estimando {TAMANHO_MEDIO_TILE_KB} KB por tile)")
+    if estimativa_mb > args.tamanho_mb:
+        print(f"Aviso: a estimativa excede o cache de {args.tamanho_mb} MB; os tiles mais antigos serão "
+              "despejados. Aumente --tamanho-mb ou reduza --zoom-max.", file=sys.stderr)
+
+    def progresso(zoom, x, y, baixados):
+        if baixados % 100 == 0:
+            print(f"\rzoom {zoom}: {baixados} tiles no cache", end="", flush=True)
+
+    total = cache.pre_carregar(tuple(args.bbox), args.zoom_min, args.zoom_max, progresso)
+    print(f"\n{total} tiles disponíveis; cache com {cache.tamanho_total / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+import math
+import os
+import re
+from datetime import datetime
+
+from georreferenciamento import (
+    parsear_pontos,
+    calcular_area_perimetro,
+    converter_para_hectares,
+    verificar_discrepancia_area,
+)
+
+# Funções centrais compartilhadas pela interface Streamlit (app.py) e pela API HTTP (api.py).
+# Este módulo não depende do Streamlit.
+
+MODELO_OPENAI = "gpt-4o-mini"
+
+PROMPT_SISTEMA = "Você é um assistente especializado em correção gramatical, coesão e coerência de textos oficiais da Polícia Militar. Corrija apenas erros gramaticais, melhore a coesão e coerência do texto, mantendo o formato original e o tom formal. Não altere informações factuais ou dados específicos."
+
+# Campos obrigatórios: chave em `dados` -> rótulo exibido nas mensagens de erro
+ROTULOS_CAMPOS_OBRIGATORIOS = {
+    'data': "Data da visita",
+    'hora_inicio': "Hora de início",
+    'hora_fim': "Hora de término",
+    'nome_propriedade': "Nome da propriedade",
+    'endereco': "Endereço completo",
+    'municipio': "Município",
+    'lat_long_porteira': "Coordenadas da porteira",
+    'lat_long_sede': "Coordenadas da sede",
+    'area': "Área da propriedade",
+    'nome_proprietario': "Nome do proprietário",
+    'cpf_cnpj': "CPF/CNPJ",
+    'telefone': "Telefone",
+    'atividade_principal': "Atividade principal",
+    'numero_placa': "Número da placa",
+}
+
+# Campos de texto opcionais de `dados`: se presentes, também devem ser strings
+CAMPOS_TEXTO_OPCIONAIS = ("tipo_propriedade", "uf", "unidade_area", "veiculos", "marca_gado", "pontos_perimetro")
+
+def validar_formato_hora_strptime(hora_str: str) -> bool:
+    """Valida se a string da hora está no formato HH:MM e se os valores são válidos."""
+    if not isinstance(hora_str, str):
+        return False
+    
+    # Remove espaços em branco
+    hora_str = hora_str.strip()
+    
+    # Verifica se está vazio
+    if not hora_str:
+        return False
+    
+    # Verifica formato básico com regex
+    if not re.match(r'^\d{1,2}:\d{2}$', hora_str):
+        return False
+    
+    try:
+        # Tenta fazer o parse
+        # strptime("%H:%M") espera horas como "00"-"23" e minutos "00"-"59".
+        # Se a regex permitir "H:MM", strptime falhará para horas de um dígito sem zero à esquerda.
+        # No entanto, o placeholder e a ajuda sugerem "HH:MM", então o comportamento atual está ok.
+        time_obj = datetime.strptime(hora_str, "%H:%M")
+        
+        # Validação adicional dos valores (pode ser redundante se strptime for bem-sucedido, mas não prejudica)
+        parts = hora_str.split(':')
+        if len(parts) != 2: # Já coberto pelo regex e strptime, mas para segurança.
+            return False
+            
+        hour = int(parts[0])
+        minute = int(parts[1])
+        
+        # Verifica se hora e minuto estão em ranges válidos
+        if hour < 0 or hour > 23:
+            return False
+        if minute < 0 or minute > 59:
+            return False
+            
+        return True
+    except (ValueError, IndexError):
+        return False
+
+def validar_campos(campos_obrigatorios_dict: dict, hora_inicio: str, hora_fim: str, area):
+    """Valida os campos obrigatórios e o formato das horas.
+
+    Retorna (campos_vazios_nomes, erros_formato_hora) com os rótulos dos campos com problema.
+    """
+    campos_vazios_nomes = []
+    for nome, valor in campos_obrigatorios_dict.items():
+        if isinstance(valor, str) and not valor.strip(): # Checa strings vazias ou só com espaços
+            campos_vazios_nomes.append(nome)
+        elif valor is None: # Checa None para campos não-string (como data_visita, area)
+             if nome == "Área da propriedade" and (area is None or area <=0) : 
+                 if nome not in campos_vazios_nomes: campos_vazios_nomes.append(nome + " (deve ser > 0)")
+             elif nome != "Área da propriedade": 
+                 campos_vazios_nomes.append(nome)
+
+    if area is None or area <= 0: # Garantir que a área seja validada mesmo se não for None, mas <=0
+        if "Área da propriedade (deve ser > 0)" not in campos_vazios_nomes and \
+           "Área da propriedade" not in campos_vazios_nomes :
+             campos_vazios_nomes.append("Área da propriedade (deve ser > 0)")
+
+    erros_formato_hora = []
+    if not hora_inicio: # Adicionado para checar se o campo obrigatório de hora está vazio
+        if "Hora de início" not in campos_vazios_nomes: campos_vazios_nomes.append("Hora de início")
+    elif not validar_formato_hora_strptime(hora_inicio):
+        erros_formato_hora.append("Hora de início")
+
+    if not hora_fim: # Adicionado para checar se o campo obrigatório de hora está vazio
+        if "Hora de término" not in campos_vazios_nomes: campos_vazios_nomes.append("Hora de término")
+    elif not validar_formato_hora_strptime(hora_fim):
+        erros_formato_hora.append("Hora de término")
+
+    return campos_vazios_nomes, erros_formato_hora
+
+def validar_entrada(entrada: dict):
+    """Valida uma entrada com as mesmas chaves de `dados` (usada pela API); retorna lista de erros."""
+    # Campos de texto com outro tipo (número, lista...) são recusados antes de qualquer outra checagem
+    tipos_invalidos = [
+        rotulo for chave, rotulo in ROTULOS_CAMPOS_OBRIGATORIOS.items()
+        if chave != 'area' and entrada.get(chave) is not None and not isinstance(entrada[chave], str)
+    ] + [
+        chave for chave in CAMPOS_TEXTO_OPCIONAIS
+        if entrada.get(chave) is not None and not isinstance(entrada[chave], str)
+    ]
+    if tipos_invalidos:
+        return [f"Os campos devem ser texto: {', '.join(tipos_invalidos)}"]
+
+    campos_obrigatorios_dict = {
+        rotulo: entrada.get(chave) for chave, rotulo in ROTULOS_CAMPOS_OBRIGATORIOS.items()
+    }
+    area = entrada.get('area')
+    try:
+        area = float(area) if area is not None and not isinstance(area, bool) else None
+    except (TypeError, ValueError):
+        area = None
+    if area is not None and not math.isfinite(area):
+        area = None
+    campos_obrigatorios_dict["Área da propriedade"] = area
+
+    campos_vazios_nomes, erros_formato_hora = validar_campos(
+        campos_obrigatorios_dict, entrada.get('hora_inicio') or "", entrada.get('hora_fim') or "", area
+    )
+
+    erros = []
+    if campos_vazios_nomes:
+        erros.append(f"Preencha todos os campos obrigatórios: {', '.join(sorted(set(campos_vazios_nomes)))}")
+    if erros_formato_hora:
+        erros.append(f"Formato de hora inválido para: {', '.join(erros_formato_hora)}. Use o formato HH:MM.")
+    if (entrada.get('data') or "").strip():
+        try:
+            datetime.strptime(entrada['data'].strip(), "%d/%m/%Y")
+        except ValueError:
+            erros.append("Data da visita inválida. Use o formato DD/MM/AAAA.")
+    if entrada.get('unidade_area', "hectares") not in ("hectares", "alqueires"):
+        erros.append("Unidade de área deve ser 'hectares' ou 'alqueires'.")
+    if (entrada.get('pontos_perimetro') or "").strip():
+        try:
+            calcular_area_perimetro(parsear_pontos(entrada['pontos_perimetro']))
+        except ValueError as e:
+            erros.append(f"Pontos do perímetro inválidos: {e}")
+    return erros
+
+def montar_dados(entrada: dict):
+    """Monta o dicionário `dados` de gerar_historico a partir de uma entrada já validada.
+
+    Retorna (dados, alertas); alertas traz avisos não impeditivos, como divergência de área.
+    """
+    area = float(entrada['area'])
+    unidade_area = entrada.get('unidade_area', "hectares")
+    veiculos = entrada.get('veiculos') or ""
+    marca_gado = entrada.get('marca_gado') or ""
+    dados = {
+        'data': entrada['data'].strip(),
+        'hora_inicio': entrada['hora_inicio'].strip(),
+        'hora_fim': entrada['hora_fim'].strip(),
+        'tipo_propriedade': entrada.get('tipo_propriedade') or "Sítio",
+        'nome_propriedade': entrada['nome_propriedade'],
+        'endereco': entrada['endereco'],
+        'municipio': entrada['municipio'],
+        'uf': entrada.get('uf') or "RO",
+        'lat_long_porteira': entrada['lat_long_porteira'],
+        'lat_long_sede': entrada['lat_long_sede'],
+        'area': f"{area:.2f}",
+        'unidade_area': unidade_area,
+        'nome_proprietario': entrada['nome_proprietario'],
+        'cpf_cnpj': entrada['cpf_cnpj'],
+        'telefone': entrada['telefone'],
+        'atividade_principal': entrada['atividade_principal'],
+        'veiculos': veiculos if veiculos.strip() else "",
+        'marca_gado': marca_gado if marca_gado.strip() else "",
+        'numero_placa': entrada['numero_placa'],
+    }
+
+    alertas = []
+    if (entrada.get('pontos_perimetro') or "").strip():
+        perimetro = calcular_area_perimetro(parsear_pontos(entrada['pontos_perimetro']))
+        adicionar_perimetro(dados, perimetro)
+        discrepancia = verificar_discrepancia_area(converter_para_hectares(area, unidade_area), perimetro['area_ha'])
+        if discrepancia is not None:
+            alertas.append(f"A área declarada difere {discrepancia:+.0%} da área calculada pelo perímetro ({perimetro['area_ha']:.2f} ha).")
+    return dados, alertas
+
+def adicionar_perimetro(dados: dict, perimetro: dict):
+    """Inclui em `dados` os valores calculados a partir do perímetro georreferenciado."""
+    dados['area_georreferenciada'] = f"{perimetro['area_ha']:.2f}"
+    dados['perimetro'] = f"{perimetro['perimetro_m']:.0f}"
+    dados['centroide'] = f"{perimetro['centroide'][0]:.8f}, {perimetro['centroide'][1]:.8f}"
+    dados['num_pontos_perimetro'] = perimetro['num_pontos']
+
+def refinar_texto(client, texto, cache=None):
+    """Refina o texto com a OpenAI; exceções de conexão são propagadas ao chamador.
+
+    Se `cache` (estado.CacheRefinamento) for informado, textos já refinados por qualquer
+    réplica com os mesmos parâmetros de chamada não geram nova chamada à API.
+    """
+    parametros = {
+        'model': MODELO_OPENAI,
+        'messages': [
+            {
+                "role": "system",
+                "content": PROMPT_SISTEMA
+            },
+            {
+                "role": "user",
+                "content": f"Por favor, corrija este relatório policial mantendo todas as informações originais, apenas melhorando a gramática, coesão e coerência:\n\n{texto}"
+            }
+        ],
+        'max_tokens': 2000, # Ajuste conforme necessário
+        'temperature': 0.3,
+    }
+    if cache is not None:
+        refinado = cache.obter(parametros)
+        if refinado is not None:
+            return refinado
+
+    response = client.chat.completions.create(**parametros)
+    refinado = response.choices[0].message.content
+    if cache is not None:
+        cache.guardar(parametros, refinado)
+    return refinado
+
+def obter_chave_openai():
+    """Lê a chave da OpenAI da variável de ambiente ou do .streamlit/secrets.toml."""
+    if os.environ.get("OPENAI_API_KEY"):
+        return os.environ["OPENAI_API_KEY"]
+    import toml
+    return toml.load(os.path.join(".streamlit", "secrets.toml"))["OPENAI_API_KEY"]
+
+def gerar_historico(dados):
+    # Template permanece o mesmo
+    template = f"""Em atendimento à Ordem de Serviço, vinculada ao Programa de Segurança Rural no Vale do Jamari, foi realizada uma visita técnica em {dados['data']}, com início às {dados['hora_inicio']} e término às {dados['hora_fim']}. A diligência ocorreu na propriedade rural denominada {dados['tipo_propriedade']} "{dados['nome_propriedade']}", situada em {dados['endereco']}, na Zona Rural do município de {dados['municipio']}/{dados['uf']}. Procedeu-se ao levantamento das coordenadas geográficas, sendo a porteira de acesso principal localizada em {dados['lat_long_porteira']}, e a sede/residência principal em {dados['lat_long_sede']}. A área total da propriedade compreende {dados['area']} {dados['unidade_area']}. O proprietário, Sr. "{dados['nome_proprietario']}", inscrito no CPF/CNPJ sob o nº "{dados['cpf_cnpj']}", com contato telefônico principal "{dados['telefone']}", esteve presente durante a visita. A principal atividade econômica desenvolvida no local é "{dados['atividade_principal']}"."""
+    if dados.get('area_georreferenciada'):
+        template += f" O perímetro da propriedade foi georreferenciado in loco por meio de {dados['num_pontos_perimetro']} pontos coletados ao longo das divisas, resultando em área calculada de {dados['area_georreferenciada']} hectares, perímetro de {dados['perimetro']} metros e ponto central em {dados['centroide']}."
+    if dados['veiculos']:
+        template += f" Foram identificados os seguintes veículos automotores na propriedade: {dados['veiculos']}."
+    if dados['marca_gado']:
+        template += f" O rebanho possui marca/sinal/ferro registrado como \"{dados['marca_gado']}\"."
+    template += f""" A visita teve como objetivo central o cadastro e georreferenciamento da propriedade no sistema do Programa de Segurança Rural, o que foi efetivado. Consequentemente, foi afixada a placa de identificação do programa, de nº "{dados['numero_placa']}", entregue via mídia digital. Adicionalmente, foram repassadas ao proprietário orientações concernentes ao programa mencionado, a fim de sanar as dúvidas existentes. A presente visita cumpriu os objetivos estabelecidos pela referida Ordem de Serviço, sendo as informações coletadas e registradas com base nas declarações do proprietário e na verificação in loco."""
+    return template
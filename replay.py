@@ -0,0 +1,507 @@
+import argparse
+import difflib
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import statistics
+import sys
+import threading
+import time
+import unicodedata
+
+from auditoria import JornalAuditoria
+from nucleo import validar_entrada, montar_dados, gerar_historico, refinar_texto
+
+# Reexecução de entradas gravadas pelo pipeline (validação -> gerar_historico -> refinamento),
+# com a IA substituída por um simulador determinístico ou pelas respostas gravadas no jornal.
+# Mede vazão, latência p50/p95, tokens e o quanto cada saída difere da linha de base gravada.
+#
+#   python replay.py anonimizar --jornal dados/auditoria --saida corpus.jsonl
+#   python replay.py executar corpus.jsonl --llm gravado --limite-similaridade 0.98
+
+# Chave secreta dos pseudônimos (HMAC). Fica fora do corpus: sem ela não é possível testar
+# CPFs ou telefones candidatos contra os pseudônimos.
+CHAVE_PADRAO_PATH = os.environ.get("REPLAY_CHAVE_PATH", os.path.join("dados", "replay.chave"))
+
+# Campos de texto da entrada que não são sensíveis, mas podem conter o nome do proprietário
+# (ex.: propriedade "São José" de José); nos textos refinados esses trechos são preservados.
+CAMPOS_PRESERVADOS = ("nome_propriedade", "tipo_propriedade", "municipio", "atividade_principal", "marca_gado")
+
+# As coordenadas são deslocadas por um vetor fixo por propriedade, derivado da chave: a geometria
+# (área, perímetro) se mantém e a localização fica incerta em alguns quilômetros.
+DESLOCAMENTO_MINIMO_GRAUS = 0.01
+DESLOCAMENTO_MAXIMO_GRAUS = 0.02
+
+# Coordenadas deslocadas saem com ao menos estas casas decimais (~0,1 m), para que todos os pontos
+# recebam o mesmo deslocamento, qualquer que seja a precisão digitada
+CASAS_DECIMAIS_MINIMAS = 6
+
+# Pares "lat, long" no mesmo formato lido por parsear_pontos, em qualquer precisão
+_PADRAO_PAR = re.compile(r"(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)")
+# No texto refinado: pares com casas decimais ou valores soltos com 4 ou mais casas
+_PADRAO_COORDENADA_TEXTO = re.compile(
+    r"(?<![\d.,])(?P<lat>-?\d{1,3}\.\d+)(?P<meio>\s*,\s*)(?P<lon>-?\d{1,3}\.\d+)(?!\.?\d)"
+    r"|(?<![\d.])(?P<valor>-?\d{1,3}[.,]\d{4,})(?!\d)"
+)
+_PADRAO_PLACA = re.compile(r"(?<![A-Za-z0-9])([A-Za-z]{3})([-\s]?)(\d)([A-Za-z0-9])(\d{2})(?![A-Za-z0-9])")
+_VARIANTES_LETRAS = {"a": "aáàâã", "e": "eéèê", "i": "iíì", "o": "oóòôõ", "u": "uúùü", "c": "cç"}
+
+# Aproximação usual para português/inglês: ~4 caracteres por token
+CARACTERES_POR_TOKEN = 4
+
+
+def estimar_tokens(texto):
+    return max(1, len(texto) // CARACTERES_POR_TOKEN)
+
+
+class _Resposta:
+    def __init__(self, conteudo, tokens_prompt, tokens_resposta):
+        mensagem = type("Mensagem", (), {"content": conteudo})()
+        self.choices = [type("Escolha", (), {"message": mensagem})()]
+        self.usage = type("Uso", (), {"prompt_tokens": tokens_prompt, "completion_tokens": tokens_resposta})()
+
+
+class ClienteSimulado:
+    """Imita client.chat.completions.create sem rede.
+
+    Por padrão devolve o próprio texto com espaços normalizados (saída determinística). Se
+    `respostas` for informado, devolve a resposta gravada para o texto (por hash). Contabiliza
+    chamadas e tokens estimados.
+    """
+
+    def __init__(self, latencia=0.0, respostas=None):
+        self.latencia = latencia
+        self.respostas = respostas
+        self.chamadas = 0
+        self.sem_resposta_gravada = 0
+        self.tokens_prompt = 0
+        self.tokens_resposta = 0
+        self.chat = self
+        self.completions = self
+        self._lock = threading.Lock()
+
+    def create(self, messages, **kwargs):
+        texto = messages[-1]["content"].split("\n\n", 1)[-1]
+        resposta = " ".join(texto.split())
+        sem_resposta = False
+        if self.respostas is not None:
+            gravada = self.respostas.get(resumo_texto(texto))
+            if gravada is None:
+                sem_resposta = True
+            else:
+                resposta = gravada
+        if self.latencia:
+            time.sleep(self.latencia)
+
+        tokens_prompt = sum(estimar_tokens(m["content"]) for m in messages)
+        tokens_resposta = estimar_tokens(resposta)
+        with self._lock:
+            self.chamadas += 1
+            self.sem_resposta_gravada += sem_resposta
+            self.tokens_prompt += tokens_prompt
+            self.tokens_resposta += tokens_resposta
+        return _Resposta(resposta, tokens_prompt, tokens_resposta)
+
+
+def resumo_texto(texto):
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def carregar_chave(caminho=CHAVE_PADRAO_PATH):
+    """Lê a chave dos pseudônimos de REPLAY_CHAVE ou do arquivo, criando-o (modo 0600) na primeira vez."""
+    if os.environ.get("REPLAY_CHAVE"):
+        return os.environ["REPLAY_CHAVE"].encode("utf-8")
+    if not os.path.exists(caminho):
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        with os.fdopen(os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as arquivo:
+            arquivo.write(secrets.token_hex(32))
+        print(f"Chave de pseudônimos criada em {caminho}; não a distribua junto com o corpus.", file=sys.stderr)
+    with open(caminho, encoding="utf-8") as arquivo:
+        return arquivo.read().strip().encode("utf-8")
+
+
+def _pseudonimo(valor, prefixo, chave):
+    return hmac.new(chave, f"{prefixo}:{valor}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _digitos_pseudonimos(valor, prefixo, chave):
+    return str(int(_pseudonimo(valor, prefixo, chave), 16))
+
+
+def _padrao_literal(texto):
+    """Regex do texto sem distinguir maiúsculas e acentos, com espaços flexíveis e limites de palavra."""
+    partes = []
+    for caractere in texto.strip():
+        if caractere.isspace():
+            if partes and partes[-1] != r"\s+":
+                partes.append(r"\s+")
+            continue
+        base = unicodedata.normalize("NFD", caractere.lower())[0]
+        partes.append(f"[{_VARIANTES_LETRAS[base]}]" if base in _VARIANTES_LETRAS else re.escape(caractere))
+    return r"(?<!\w)" + "".join(partes) + r"(?!\w)"
+
+
+def _padrao_digitos(digitos):
+    """Regex da sequência de dígitos com qualquer pontuação entre eles (CPF, telefone reformatados)."""
+    return r"(?<!\d)\(?" + r"[\s.\-/()]*".join(digitos) + r"(?!\d)"
+
+
+def _formatar_documento(digitos):
+    if len(digitos) == 14:
+        return f"{digitos[:2]}.{digitos[2:5]}.{digitos[5:8]}/{digitos[8:12]}-{digitos[12:]}"
+    if len(digitos) == 11:
+        return f"{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}"
+    return digitos
+
+
+def _formatar_telefone(digitos):
+    if len(digitos) in (10, 11):
+        return f"({digitos[:2]}) {_formatar_telefone(digitos[2:])}"
+    if len(digitos) in (8, 9):
+        return f"{digitos[:-4]}-{digitos[-4:]}"
+    return digitos
+
+
+def _casas_decimais(texto):
+    return len(texto.replace(",", ".").partition(".")[2])
+
+
+def _formatar_grau(valor, casas, separador="."):
+    return f"{valor:.{max(casas, CASAS_DECIMAIS_MINIMAS)}f}".replace(".", separador)
+
+
+def _deslocamento(entrada, chave):
+    """Referência (lat, long) da propriedade e deslocamento fixo derivado da chave; None sem coordenadas."""
+    for campo in ("lat_long_sede", "lat_long_porteira", "pontos_perimetro"):
+        par = _PADRAO_PAR.search(entrada.get(campo) or "")
+        if par:
+            referencia = (float(par.group(1)), float(par.group(2)))
+            break
+    else:
+        return None
+    resumo = _pseudonimo(f"{referencia[0]:.3f},{referencia[1]:.3f}", "coordenadas", chave)
+    deslocamento = []
+    for inicio in (0, 8):
+        fracao = int(resumo[inicio:inicio + 8], 16) / 0xFFFFFFFF
+        sinal = 1 if int(resumo[16 + inicio // 8], 16) % 2 else -1
+        deslocamento.append(sinal * (DESLOCAMENTO_MINIMO_GRAUS + fracao * (DESLOCAMENTO_MAXIMO_GRAUS - DESLOCAMENTO_MINIMO_GRAUS)))
+    return referencia, tuple(deslocamento)
+
+
+def _deslocar_coordenadas(texto, deslocamento):
+    """Desloca todos os pares "lat, long" de um campo de coordenadas, em qualquer precisão."""
+    def trocar(m):
+        lat, lon = m.group(1), m.group(2)
+        meio = m.group(0)[len(lat):len(m.group(0)) - len(lon)]
+        return (_formatar_grau(float(lat) + deslocamento[0], _casas_decimais(lat)) + meio
+                + _formatar_grau(float(lon) + deslocamento[1], _casas_decimais(lon)))
+    return _PADRAO_PAR.sub(trocar, texto)
+
+
+def _deslocar_no_texto(texto, referencia, deslocamento):
+    """Desloca, num texto livre, as latitudes e longitudes próximas da referência (o sinal pode ter sido omitido)."""
+    def perto(valor, ref):
+        return abs(abs(valor) - abs(ref)) < 1
+
+    def deslocar(numero, ref, delta):
+        separador = "," if "," in numero else "."
+        valor = float(numero.replace(",", "."))
+        novo = valor + delta if (valor < 0) == (ref < 0) else valor - delta
+        return _formatar_grau(novo, _casas_decimais(numero), separador)
+
+    def deslocar_solto(numero):
+        valor = float(numero.replace(",", "."))
+        for ref, delta in zip(referencia, deslocamento):
+            if perto(valor, ref):
+                return deslocar(numero, ref, delta)
+        return numero
+
+    def trocar(m):
+        if m.group("valor"):
+            return deslocar_solto(m.group("valor"))
+        lat, lon = m.group("lat"), m.group("lon")
+        if perto(float(lat), referencia[0]) and perto(float(lon), referencia[1]):
+            return deslocar(lat, referencia[0], deslocamento[0]) + m.group("meio") + deslocar(lon, referencia[1], deslocamento[1])
+        return deslocar_solto(lat) + m.group("meio") + deslocar_solto(lon)
+    return _PADRAO_COORDENADA_TEXTO.sub(trocar, texto)
+
+
+def _trocar_placas(texto, chave):
+    def trocar(m):
+        digitos = _digitos_pseudonimos("".join(m.groups()[i] for i in (0, 2, 3, 4)).upper(), "placa", chave)
+        letras = "".join(chr(ord("A") + int(digitos[i:i + 2]) % 26) for i in (0, 2, 4, 6))
+        quinto = letras[3] if m.group(4).isalpha() else digitos[8]
+        return f"{letras[:3]}{m.group(2)}{digitos[9]}{quinto}{digitos[10:12]}"
+    return _PADRAO_PLACA.sub(trocar, texto)
+
+
+def gerar_linha_de_base(entrada):
+    """Histórico gerado pelo código atual para a entrada, ou None se ela não passa na validação."""
+    if validar_entrada(entrada):
+        return None
+    dados, _ = montar_dados(entrada)
+    return gerar_historico(dados)
+
+
+def anonimizar_evento(evento, chave):
+    """Pseudonimiza os dados pessoais da entrada e do texto refinado gravado.
+
+    Nome, CPF/CNPJ, telefone, endereço e placas de veículos viram pseudônimos HMAC; as coordenadas
+    são deslocadas. O histórico de base é regerado a partir da entrada anonimizada, em vez de editado.
+    """
+    entrada = dict(evento.get("entrada") or {})
+    substituicoes = []
+
+    endereco = entrada.get("endereco")
+    if isinstance(endereco, str) and endereco.strip():
+        anonimo = f"Endereço {_pseudonimo(endereco.strip().lower(), 'endereco', chave)[:6].upper()}"
+        substituicoes.append((re.compile(_padrao_literal(endereco), re.IGNORECASE), anonimo))
+        entrada["endereco"] = anonimo
+
+    # O endereço vem antes do nome, que pode fazer parte dele ("Linha do José")
+    nome = entrada.get("nome_proprietario")
+    if isinstance(nome, str) and nome.strip():
+        anonimo = f"Proprietário {_pseudonimo(nome.strip().lower(), 'nome', chave)[:6].upper()}"
+        preservados = [
+            _padrao_literal(entrada[campo]) for campo in CAMPOS_PRESERVADOS
+            if isinstance(entrada.get(campo), str) and entrada[campo].strip()
+            and re.search(_padrao_literal(nome), entrada[campo], re.IGNORECASE)
+        ]
+        padrao = "|".join([f"(?P<preservado>{'|'.join(preservados)})"] * bool(preservados) + [f"(?:{_padrao_literal(nome)})"])
+        substituicoes.append((re.compile(padrao, re.IGNORECASE),
+                              lambda m, anonimo=anonimo: m.group(0) if m.groupdict().get("preservado") else anonimo))
+        entrada["nome_proprietario"] = anonimo
+
+    for campo, formatar in (("cpf_cnpj", _formatar_documento), ("telefone", _formatar_telefone)):
+        original = entrada.get(campo)
+        if not isinstance(original, str) or not original.strip():
+            continue
+        digitos = "".join(c for c in original if c.isdigit())
+        if not digitos:
+            entrada[campo] = f"{campo.upper()} {_pseudonimo(original, campo, chave)[:6].upper()}"
+            substituicoes.append((re.compile(_padrao_literal(original), re.IGNORECASE), entrada[campo]))
+            continue
+        # Telefone mantém o DDD; o número local também é procurado sozinho nos textos
+        mantidos = digitos[:2] if campo == "telefone" and len(digitos) in (10, 11) else ""
+        anonimo = mantidos + _digitos_pseudonimos(digitos, campo, chave)[:len(digitos) - len(mantidos)]
+        entrada[campo] = formatar(anonimo)
+        substituicoes.append((re.compile(_padrao_digitos(digitos)), formatar(anonimo)))
+        if mantidos:
+            substituicoes.append((re.compile(_padrao_digitos(digitos[2:])), formatar(anonimo[2:])))
+
+    if isinstance(entrada.get("veiculos"), str):
+        entrada["veiculos"] = _trocar_placas(entrada["veiculos"], chave)
+
+    coordenadas = _deslocamento(entrada, chave)
+    if coordenadas:
+        for campo in ("lat_long_porteira", "lat_long_sede", "pontos_perimetro"):
+            if isinstance(entrada.get(campo), str):
+                entrada[campo] = _deslocar_coordenadas(entrada[campo], coordenadas[1])
+
+    refinado = evento.get("refinado")
+    if refinado:
+        for padrao, anonimo in substituicoes:
+            refinado = padrao.sub(anonimo, refinado)
+        refinado = _trocar_placas(refinado, chave)
+        if coordenadas:
+            refinado = _deslocar_no_texto(refinado, *coordenadas)
+
+    return {"id": evento.get("id"), "entrada": entrada, "historico": gerar_linha_de_base(entrada), "refinado": refinado}
+
+
+def carregar_corpus(caminho):
+    with open(caminho, encoding="utf-8") as arquivo:
+        return [json.loads(linha) for linha in arquivo if linha.strip()]
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def similaridade(a, b):
+    if a is None or b is None:
+        return None
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def executar_corpus(corpus, cliente):
+    """Passa cada evento do corpus pelo pipeline e retorna a lista de resultados por evento.
+
+    As saídas são guardadas para comparação posterior com comparar_com_base(), fora da medição.
+    """
+    resultados = []
+    for evento in corpus:
+        entrada = evento["entrada"]
+        inicio = time.perf_counter()
+        erros = validar_entrada(entrada)
+        if erros:
+            resultados.append({"id": evento.get("id"), "erros": erros})
+            continue
+        dados, _ = montar_dados(entrada)
+        historico = gerar_historico(dados)
+        fim_geracao = time.perf_counter()
+        refinado = refinar_texto(cliente, historico)
+        fim = time.perf_counter()
+        resultados.append({
+            "id": evento.get("id"),
+            "geracao_ms": (fim_geracao - inicio) * 1000,
+            "total_ms": (fim - inicio) * 1000,
+            "historico": historico,
+            "refinado": refinado,
+            "evento": evento,
+        })
+    return resultados
+
+
+def comparar_com_base(resultados):
+    """Calcula a similaridade (0-1) de cada saída com o texto gravado na linha de base."""
+    for resultado in resultados:
+        if "erros" in resultado:
+            continue
+        evento = resultado.pop("evento")
+        resultado["similaridade_historico"] = similaridade(resultado["historico"], evento.get("historico"))
+        resultado["similaridade_refinado"] = similaridade(resultado["refinado"], evento.get("refinado"))
+    return resultados
+
+
+def similaridades_por_evento(resultados):
+    """Similaridade de cada evento (a menor entre as repetições) e erros de validação, na ordem do corpus."""
+    por_evento = {}
+    for resultado in resultados:
+        atual = por_evento.setdefault(resultado["id"], {"id": resultado["id"]})
+        if "erros" in resultado:
+            atual["erros"] = resultado["erros"]
+            continue
+        for chave in ("similaridade_historico", "similaridade_refinado"):
+            valor = resultado[chave]
+            if valor is not None and (atual.get(chave) is None or valor < atual[chave]):
+                atual[chave] = valor
+            atual.setdefault(chave, None)
+    return list(por_evento.values())
+
+
+def relatorio(resultados, duracao, cliente, limite_similaridade=None):
+    validos = [r for r in resultados if "erros" not in r]
+    eventos = similaridades_por_evento(resultados)
+    sim_historico = [r["similaridade_historico"] for r in validos if r["similaridade_historico"] is not None]
+    sim_refinado = [r["similaridade_refinado"] for r in validos if r["similaridade_refinado"] is not None]
+    return {
+        "eventos": len(resultados),
+        "falhas_validacao": len(resultados) - len(validos),
+        "vazao_por_s": len(validos) / duracao if duracao else 0.0,
+        "geracao_p50_ms": percentil([r["geracao_ms"] for r in validos], 50),
+        "geracao_p95_ms": percentil([r["geracao_ms"] for r in validos], 95),
+        "total_p50_ms": percentil([r["total_ms"] for r in validos], 50),
+        "total_p95_ms": percentil([r["total_ms"] for r in validos], 95),
+        "chamadas_llm": cliente.chamadas,
+        "sem_resposta_gravada": cliente.sem_resposta_gravada,
+        "tokens_prompt": cliente.tokens_prompt,
+        "tokens_resposta": cliente.tokens_resposta,
+        "historicos_alterados": sum(1 for s in sim_historico if s < 1.0),
+        "similaridade_historico_media": statistics.fmean(sim_historico) if sim_historico else None,
+        "similaridade_historico_min": min(sim_historico, default=None),
+        "similaridade_refinado_media": statistics.fmean(sim_refinado) if sim_refinado else None,
+        "similaridade_refinado_min": min(sim_refinado, default=None),
+        "abaixo_do_limite": [
+            e for e in eventos
+            if limite_similaridade is not None and any(
+                e.get(chave) is not None and e[chave] < limite_similaridade
+                for chave in ("similaridade_historico", "similaridade_refinado"))
+        ],
+        "por_evento": eventos,
+    }
+
+
+def comando_anonimizar(args):
+    chave = carregar_chave(args.chave_arquivo)
+    jornal = JornalAuditoria(args.jornal)
+    eventos = jornal.ler(args.data, args.placa)
+    jornal.fechar()
+    divergentes = 0
+    with open(args.saida, "w", encoding="utf-8") as saida:
+        for evento in eventos:
+            divergentes += evento.get("historico") != gerar_linha_de_base(evento.get("entrada") or {})
+            saida.write(json.dumps(anonimizar_evento(evento, chave), ensure_ascii=False) + "\n")
+    print(f"{len(eventos)} eventos anonimizados gravados em {args.saida}")
+    if divergentes:
+        print(f"⚠️ {divergentes} históricos gravados diferem dos gerados pelo código atual; a linha de base"
+              " do corpus é a do código atual.", file=sys.stderr)
+    return 0
+
+
+def comando_executar(args):
+    corpus = carregar_corpus(args.corpus)
+    respostas = None
+    if args.llm == "gravado":
+        respostas = {resumo_texto(e["historico"]): e["refinado"] for e in corpus if e.get("historico") and e.get("refinado")}
+    cliente = ClienteSimulado(latencia=args.latencia_ms / 1000, respostas=respostas)
+
+    resultados = []
+    inicio = time.perf_counter()
+    for _ in range(args.repeticoes):
+        resultados.extend(executar_corpus(corpus, cliente))
+    duracao = time.perf_counter() - inicio
+    metricas = relatorio(comparar_com_base(resultados), duracao, cliente, args.limite_similaridade)
+
+    if args.json:
+        print(json.dumps(metricas, ensure_ascii=False, indent=2))
+    else:
+        for chave, valor in metricas.items():
+            if chave in ("abaixo_do_limite", "por_evento"):
+                continue
+            print(f"{chave:>30}: {valor:.4f}" if isinstance(valor, float) else f"{chave:>30}: {valor}")
+
+    # Limites para uso em CI: código de saída 1 se algum for ultrapassado
+    violacoes = []
+    if args.limite_p95_ms is not None and metricas["total_p95_ms"] > args.limite_p95_ms:
+        violacoes.append(f"p95 {metricas['total_p95_ms']:.2f} ms > {args.limite_p95_ms} ms")
+    for evento in metricas["abaixo_do_limite"]:
+        similaridades = ", ".join(f"{chave} {evento[chave]:.4f}" for chave in ("similaridade_historico", "similaridade_refinado")
+                                  if evento[chave] is not None and evento[chave] < args.limite_similaridade)
+        violacoes.append(f"evento {evento['id']}: {similaridades} < {args.limite_similaridade}")
+    if metricas["falhas_validacao"] and not args.permitir_falhas_validacao:
+        violacoes.append(f"{metricas['falhas_validacao']} eventos gravados não passam mais na validação")
+    for violacao in violacoes:
+        print(f"❌ {violacao}", file=sys.stderr)
+    return 1 if violacoes else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de regressão por reexecução de entradas gravadas")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    anonimizar = subcomandos.add_parser("anonimizar", help="Exporta o jornal de auditoria como corpus anonimizado")
+    anonimizar.add_argument("--jornal", default="dados/auditoria")
+    anonimizar.add_argument("--data")
+    anonimizar.add_argument("--placa")
+    anonimizar.add_argument("--saida", required=True)
+    anonimizar.add_argument("--chave-arquivo", default=CHAVE_PADRAO_PATH,
+                            help="Arquivo com a chave secreta dos pseudônimos (ignorado se REPLAY_CHAVE estiver definida)")
+
+    executar = subcomandos.add_parser("executar", help="Reexecuta o corpus pelo pipeline")
+    executar.add_argument("corpus")
+    executar.add_argument("--llm", choices=("simulado", "gravado"), default="simulado",
+                          help="simulado: determinístico; gravado: respostas do corpus")
+    executar.add_argument("--latencia-ms", type=float, default=0.0, help="Latência simulada por chamada à IA")
+    executar.add_argument("--repeticoes", type=int, default=1)
+    executar.add_argument("--limite-p95-ms", type=float)
+    executar.add_argument("--limite-similaridade", type=float, help="Similaridade mínima com a linha de base (0-1)")
+    executar.add_argument("--permitir-falhas-validacao", action="store_true")
+    executar.add_argument("--json", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.comando == "anonimizar":
+        return comando_anonimizar(args)
+    return comando_executar(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import json
+import math
+import time
+
+import numpy as np
+import pytest
+
+from estado import EstadoRedis, ServidorRespLocal
+from geocodificacao import IndiceMunicipios
+from georreferenciamento import RAIO_MEDIO_M, calcular_area_perimetro
+
+# Verificações dos cálculos de perímetro, da geocodificação em lote e do protocolo Redis.
+#   python -m pytest -q
+
+LAT0, LON0 = -9.9, -63.0
+
+
+def em_graus(metros):
+    """Converte (leste, norte) em metros, relativos a (LAT0, LON0), em pontos (lat, long)."""
+    metros = np.asarray(metros, dtype=np.float64)
+    lat = LAT0 + np.degrees(metros[:, 1] / RAIO_MEDIO_M)
+    lon = LON0 + np.degrees(metros[:, 0] / (RAIO_MEDIO_M * math.cos(math.radians(LAT0))))
+    return np.column_stack([lat, lon])
+
+
+def quadrado_percorrido(lado, passo):
+    """Contorno de um quadrado de lado `lado` (m), com um ponto a cada `passo` metros."""
+    pontos = []
+    for s in np.arange(0, 4 * lado, passo):
+        lado_atual, r = divmod(s, lado)
+        pontos.append([(r, 0), (lado, r), (lado - r, lado), (0, lado - r)][int(lado_atual)])
+    return np.array(pontos, dtype=np.float64)
+
+
+def test_area_de_quadrado_conhecido():
+    resultado = calcular_area_perimetro(em_graus([(0, 0), (1000, 0), (1000, 1000), (0, 1000)]))
+    assert resultado['area_ha'] == pytest.approx(100, rel=1e-3)
+    assert resultado['perimetro_m'] == pytest.approx(4000, rel=1e-3)
+    assert resultado['centroide'] == pytest.approx(tuple(em_graus([(500, 500)])[0]), abs=1e-6)
+
+
+def test_area_de_circulo():
+    angulos = np.linspace(0, 2 * np.pi, 2000, endpoint=False)
+    raio = 500
+    resultado = calcular_area_perimetro(em_graus(np.column_stack([raio * np.cos(angulos), raio * np.sin(angulos)])))
+    assert resultado['area_ha'] == pytest.approx(math.pi * raio ** 2 / 10_000, rel=1e-3)
+    assert resultado['perimetro_m'] == pytest.approx(2 * math.pi * raio, rel=1e-3)
+
+
+@pytest.mark.parametrize("pontos", [
+    [(0, 0), (1000, 0)],                                  # menos de 3 pontos
+    [(0, 0), (500, 0), (1000, 0)],                        # alinhados
+    [(0, 0), (500, 0), (1000, 0), (500, 0)],              # ida e volta pela mesma cerca
+    [(0, 0), (1000, 600), (1000, 0), (0, 1000)],          # gravata: cruza a si mesmo
+])
+def test_perimetro_degenerado(pontos):
+    with pytest.raises(ValueError):
+        calcular_area_perimetro(em_graus(pontos))
+
+
+def test_ruido_do_gps_nao_invalida_perimetro():
+    rng = np.random.default_rng(0)
+    contorno = quadrado_percorrido(1000, 5)
+    for _ in range(5):
+        resultado = calcular_area_perimetro(em_graus(contorno + rng.normal(0, 3, contorno.shape)))
+        assert resultado['area_ha'] == pytest.approx(100, rel=0.02)
+
+
+def test_localizar_lote_igual_a_localizar(tmp_path):
+    # Grade 3x3 de municípios quadrados de 0,2°, um deles côncavo (em L) e um buraco no centro
+    features = []
+    for i in range(3):
+        for j in range(3):
+            if (i, j) == (1, 1):
+                continue
+            x0, y0 = LON0 + 0.2 * i, LAT0 + 0.2 * j
+            anel = [[x0, y0], [x0 + 0.2, y0], [x0 + 0.2, y0 + 0.2], [x0, y0 + 0.2], [x0, y0]]
+            if (i, j) == (0, 0):
+                anel = [[x0, y0], [x0 + 0.2, y0], [x0 + 0.2, y0 + 0.1], [x0 + 0.1, y0 + 0.1],
+                        [x0 + 0.1, y0 + 0.2], [x0, y0 + 0.2], [x0, y0]]
+            features.append({"type": "Feature", "properties": {"NM_MUN": f"M{i}{j}", "SIGLA_UF": "RO", "CD_MUN": f"{i}{j}"},
+                             "geometry": {"type": "Polygon", "coordinates": [anel]}})
+    caminho = tmp_path / "malha.geojson"
+    caminho.write_text(json.dumps({"type": "FeatureCollection", "features": features}), encoding="utf-8")
+    indice = IndiceMunicipios.carregar(str(caminho), tamanho_celula=0.07)
+
+    rng = np.random.default_rng(1)
+    lats = rng.uniform(LAT0 - 0.1, LAT0 + 0.7, 2000)
+    lons = rng.uniform(LON0 - 0.1, LON0 + 0.7, 2000)
+    lote = indice.localizar_lote(lats, lons)
+    for lat, lon, posicao in zip(lats, lons, lote):
+        avulso = indice.localizar(lat, lon)
+        assert (avulso is None and posicao == -1) or avulso is indice.municipios[posicao]
+    # Fora da malha, no buraco e no recorte do L
+    assert -1 in lote
+    assert indice.localizar(LAT0 + 0.3, LON0 + 0.3) is None
+    assert indice.localizar(LAT0 + 0.15, LON0 + 0.15) is None
+
+
+@pytest.fixture
+def redis_local():
+    servidor = ServidorRespLocal()
+    servidor.iniciar_em_thread()
+    yield EstadoRedis.da_url(servidor.url)
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_estado_redis_ida_e_volta(redis_local):
+    backend = redis_local
+    assert backend.obter("chave") is None
+    backend.definir("chave", "válido ✓")
+    assert backend.obter("chave") == "válido ✓"
+    assert backend.incrementar("contador") == 1
+    assert backend.incrementar("contador") == 2
+    assert backend.remover("chave") == 1
+    assert backend.obter("chave") is None
+
+    backend.definir("temporaria", "x", ttl=1)
+    assert backend.obter("temporaria") == "x"
+    time.sleep(1.1)
+    assert backend.obter("temporaria") is None
+
+
+def test_estado_redis_fila(redis_local):
+    backend = redis_local
+    assert backend.desenfileirar("fila") is None
+    for valor in ("a", "b", "c"):
+        backend.enfileirar("fila", valor)
+    assert backend.tamanho_fila("fila") == 3
+    assert [backend.desenfileirar("fila", timeout=1) for _ in range(3)] == ["a", "b", "c"]
+    assert backend.tamanho_fila("fila") == 0
+
+    inicio = time.monotonic()
+    assert backend.desenfileirar("fila", timeout=1) is None
+    assert time.monotonic() - inicio >= 0.9
+
+    backend.enfileirar("fila", "d")
+    assert backend.expirar("fila", 1) == 1
+    assert backend.expirar("inexistente", 1) == 0
+    time.sleep(1.1)
+    assert backend.tamanho_fila("fila") == 0
@@ -0,0 +1,59 @@
+import contextlib
+import logging
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:  # POSIX
+    msvcrt = None
+
+# Trava de arquivo entre processos, portável: flock no POSIX e msvcrt.locking no Windows (onde não
+# há trava compartilhada e toda trava é exclusiva). Sem nenhum dos dois, segue sem travar e avisa.
+
+logger = logging.getLogger(__name__)
+_avisado = False
+
+
+@contextlib.contextmanager
+def travar_arquivo(caminho, exclusiva=True, bloquear=True):
+    """Trava `caminho` enquanto durar o bloco; gera False se bloquear=False e a trava estiver ocupada."""
+    global _avisado
+    with open(caminho, "a+") as arquivo:
+        if fcntl is not None:
+            modo = (fcntl.LOCK_EX if exclusiva else fcntl.LOCK_SH) | (0 if bloquear else fcntl.LOCK_NB)
+            try:
+                fcntl.flock(arquivo, modo)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(arquivo, fcntl.LOCK_UN)
+        elif msvcrt is not None:
+            while True:
+                arquivo.seek(0)
+                try:
+                    msvcrt.locking(arquivo.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not bloquear:
+                        yield False
+                        return
+                    time.sleep(0.05)
+            try:
+                yield True
+            finally:
+                arquivo.seek(0)
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            if not _avisado:
+                logger.warning("Travas de arquivo indisponíveis nesta plataforma; %s não será travado.",
+                               os.path.basename(caminho))
+                _avisado = True
+            yield True